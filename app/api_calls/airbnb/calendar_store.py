@@ -0,0 +1,131 @@
+import sqlite3
+import os
+import time
+import threading
+import numpy as np
+from datetime import date
+from typing import Callable
+
+# availability calendars kept per listing. Set TRAVEL_APP_CALENDARS to move it
+CALENDARS_PATH = os.environ.get("TRAVEL_APP_CALENDARS", os.path.join(os.path.expanduser("~"), ".cache", "travel_app", "calendars.sqlite"))
+
+# a calendar older than this is fetched again before it is used
+STALE_AFTER_SEC = 6*60*60
+
+_lock = threading.RLock()
+_connection = None
+# listing_id to (first day as a date ordinal, one bool per day, fetched_at) for calendars already loaded in this process
+_calendars = {}
+
+def _get_connection() -> sqlite3.Connection:
+    """
+    Opens the calendars database the first time it is needed and creates the calendars table
+
+    Returns:
+    - (sqlite3.Connection): connection shared by all threads, guarded by the module lock
+    """
+
+    global _connection
+
+    if _connection is None:
+        directory = os.path.dirname(CALENDARS_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _connection = sqlite3.connect(CALENDARS_PATH, check_same_thread=False)
+        _connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS calendars (
+                listing_id TEXT PRIMARY KEY,
+                first_day INTEGER NOT NULL,
+                n_days INTEGER NOT NULL,
+                available BLOB NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        _connection.commit()
+
+    return _connection
+
+def save_calendar(listing_id, results:list) -> None:
+    """
+    Converts a calendar from the availability api into one bit per day and stores it. Dates are parsed once here, never when checking
+
+    Params:
+    - listing_id: the airbnb_id the calendar belongs to
+    - results (list): the results value from the availability api call
+    """
+
+    days = np.array([date.fromisoformat(day["date"]).toordinal() for day in results], dtype=np.int64)
+    first_day = int(days.min()) if len(days) > 0 else 0
+    n_days = int(days.max()) - first_day + 1 if len(days) > 0 else 0
+
+    # days missing from the calendar count as unavailable
+    available = np.zeros(n_days, dtype=bool)
+    available[days - first_day] = [day["available"]==1 for day in results]
+    fetched_at = time.time()
+
+    with _lock:
+        connection = _get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO calendars VALUES (?, ?, ?, ?, ?)",
+            (str(listing_id), first_day, n_days, np.packbits(available).tobytes(), fetched_at)
+        )
+        connection.commit()
+        _calendars[str(listing_id)] = (first_day, available, fetched_at)
+
+def load_calendar(listing_id) -> tuple:
+    """
+    Gets a stored calendar, from memory if it has been loaded before
+
+    Params:
+    - listing_id: the airbnb_id
+
+    Returns:
+    - (tuple): first day as a date ordinal, array with one bool per day, and fetched_at. None if the listing has no calendar
+    """
+
+    listing_id = str(listing_id)
+
+    with _lock:
+        if listing_id not in _calendars:
+            row = _get_connection().execute(
+                "SELECT first_day, n_days, available, fetched_at FROM calendars WHERE listing_id = ?", (listing_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            first_day, n_days, packed, fetched_at = row
+            available = np.unpackbits(np.frombuffer(packed, dtype=np.uint8), count=n_days).astype(bool)
+            _calendars[listing_id] = (first_day, available, fetched_at)
+
+        return _calendars[listing_id]
+
+def is_available(listing_id, checkIn:str, checkOut:str, fetch_calendar:Callable[[int], list]) -> bool:
+    """
+    Determines if a listing is free every night of [checkIn, checkOut) with one slice of its stored calendar.
+    The calendar is only fetched when the listing has none stored or it is older than STALE_AFTER_SEC.
+
+    Params:
+    - listing_id: the airbnb_id
+    - checkIn (str): check in date. YYYY-MM-DD
+    - checkOut (str): check out date. YYYY-MM-DD, the night before it is the last one checked
+    - fetch_calendar (function): takes the airbnb_id and returns the results of the availability api call
+
+    Returns:
+    - (bool): False if any night is unavailable or outside the calendar
+    """
+
+    calendar = load_calendar(listing_id)
+    if calendar is None or time.time() - calendar[2] > STALE_AFTER_SEC:
+        save_calendar(listing_id, fetch_calendar(listing_id))
+        calendar = load_calendar(listing_id)
+
+    first_day, available, _ = calendar
+    start = date.fromisoformat(checkIn).toordinal() - first_day
+    # a same day check in and out still needs the check in day free
+    end = max(date.fromisoformat(checkOut).toordinal() - first_day, start + 1)
+
+    if start < 0 or end > len(available):
+        return False
+
+    return bool(available[start:end].all())
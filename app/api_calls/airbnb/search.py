@@ -1,9 +1,62 @@
-import requests
-import os
-import json
+from api_calls import sessions
 from datetime import datetime
-from typing import List
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Iterator
+from api_calls import quota
+from api_calls import listing_store
+from api_calls.airbnb import calendar_store
+from api_calls.cache import cached
+from api_calls.settings import get_settings
+from api_calls.singleflight import single_flight
+from api_calls.stays import Stay
+
+# an earlier search of an area is reused to find its airbnbs until it is this old
+STORE_MAX_AGE_SEC = 7*24*60*60
+
+# largest search radius the listings api accepts, in metres
+MAX_RANGE_M = 20000
+
+# most airbnbs the listings api returns per call, a full page means there are more at the next offset
+SEARCH_PAGE_SIZE = 50
+
+def _get_with_failover(endpoint:str, query:dict):
+    """
+    Sends a GET request with the airbnb key that has the most budget left and retries once with the other key if it fails
+
+    Params:
+    - endpoint (str): url to request
+    - query (dict): query params
+
+    Returns:
+    - (requests.Response): the successful response
+
+    Raise:
+    - if both keys return an error
+    """
+
+    key = quota.acquire("airbnb")
+    headers = {
+        "x-rapidapi-key":key,
+        "x-rapidapi-host":get_settings().airbnb_host
+        }
+    response = sessions.get(endpoint, headers=headers, params=query)
+
+    if response.status_code != 200:
+        print(f"Primary key error: {response.status_code}")
+
+        # try the other key
+        headers["x-rapidapi-key"] = quota.acquire("airbnb", exclude=[quota.key_name_for("airbnb", key)])
+        response = sessions.get(endpoint, headers=headers, params=query)
+
+        if response.status_code != 200:
+            raise Exception(f"Secondary key error: {response.status_code}")
 
+    return response
+
+@cached("listings")
+@single_flight
 def get_airbnbs_near_lat_long(lat:int, lon:int, maxGuestCapacity:int=6, range:int=500, offset:int=0) -> List[dict]:
     """
     Searches for airbnbs matching the criteria arguments
@@ -20,9 +73,6 @@ def get_airbnbs_near_lat_long(lat:int, lon:int, maxGuestCapacity:int=6, range:in
     - (list of dictionaries): airbnbs ids and proximity, in meters, to the searched coordinates. Returns None if no airbnbs are found
     """
 
-    with open("api_calls/airbnb/api_params.json", "r") as f:
-        api_params = json.load(f)
-
     query = {
         "lat":str(lat),
         "lng":str(lon),
@@ -30,22 +80,7 @@ def get_airbnbs_near_lat_long(lat:int, lon:int, maxGuestCapacity:int=6, range:in
         "offset":str(offset),
         "maxGuestCapacity":str(maxGuestCapacity)
         }
-    # use primary key first
-    headers = {
-        "x-rapidapi-key":os.environ["AIRBNB_KEY_1"],
-        "x-rapidapi-host":api_params["x-rapidapi-host"]
-        }
-    response = requests.get(api_params["endpoint_lat_long"], headers=headers, params=query)
-
-    if response.status_code != 200:
-        print(f"Primary key error: {response.status_code}")
-
-        # try the second key
-        headers["x-rapidapi-key"] = os.environ["AIRBNB_KEY_2"]
-        response = requests.get(api_params["endpoint_lat_long"], headers=headers, params=query)
-
-        if response.status_code != 200:
-            raise Exception(f"Secondary key error: {response.status_code}")
+    response = _get_with_failover(get_settings().airbnb_endpoint_lat_long, query)
         
     response = response.json()
 
@@ -66,6 +101,8 @@ def get_airbnbs_near_lat_long(lat:int, lon:int, maxGuestCapacity:int=6, range:in
 
         return None
     
+@cached("details")
+@single_flight
 def get_airbnb_details(airbnb_id:int) -> dict:
     """
     Get the listing details for a specific airbnb
@@ -74,55 +111,19 @@ def get_airbnb_details(airbnb_id:int) -> dict:
     - airbnb_id (int): the airbnb_id for which we want details
 
     Returns:
-    - (dictionary): listing details
+    - (dictionary): listing details as returned by the api, with airbnb_id, city, listingTitle, starRating, listingLat and listingLng among others
     """
 
-    with open("api_calls/airbnb/api_params.json", "r") as f:
-        api_params = json.load(f)
-
     query = {"id":airbnb_id}
-    # use primary key first
-    headers = {
-        "x-rapidapi-key":os.environ["AIRBNB_KEY_1"],
-        "x-rapidapi-host":api_params["x-rapidapi-host"]
-        }
-    response = requests.get(api_params["endpoint_details"], headers=headers, params=query)
-
-    if response.status_code != 200:
-        print(f"Primary key error: {response.status_code}")
-        # try the secondary key
-        headers["x-rapidapi-key"] = os.environ["AIRBNB_KEY_2"]
-        response = requests.get(api_params["endpoint_details"], headers=headers, params=query)
-        if response.status_code != 200:
-            raise Exception(f"Secondary key error: {response.status_code}")
+    response = _get_with_failover(get_settings().airbnb_endpoint_details, query)
 
     response = response.json()
 
-    details_dict = response["results"][0]
-    airbnb_details = {
-            "airbnb_id":details_dict["airbnb_id"],
-            "city":details_dict["city"],
-            "listingTitle": details_dict["listingTitle"],
-            "reviewCount":details_dict["reviewCount"],
-            "starRating":details_dict["starRating"],
-            "maxGuestCapacity":details_dict["maxGuestCapacity"],
-            "bedrooms":details_dict["bedrooms"],
-            "beds":details_dict["beds"],
-            "bathrooms":details_dict["bathrooms"],
-            "bathroomShared":details_dict["bathroomShared"],
-            "propertyType":details_dict["propertyType"],
-            "listingLat":details_dict["listingLat"],
-            "listingLng":details_dict["listingLng"],
-            "cancel_policy":details_dict["cancel_policy"],
-            "min_nights":details_dict["min_nights"],
-            "max_nights":details_dict["max_nights"],
-            "check_in_time":details_dict["check_in_time"],
-            "check_out_time":details_dict["check_out_time"],
-            "listingstatus":details_dict["listingstatus"]
-        }
-
-    return airbnb_details
+    # kept as the api sent it, to_stay reads a Stay straight out of it
+    return response["results"][0]
 
+@cached("availability")
+@single_flight
 def get_airbnb_calendar(airbnb_id:int) -> list:
     """
     Gets data on availability for a specific airbnb for the next 12 months.
@@ -135,24 +136,8 @@ def get_airbnb_calendar(airbnb_id:int) -> list:
     - (list): results from the api call
     """
 
-    with open("api_calls/airbnb/api_params.json", "r") as f:
-        api_params = json.load(f)
-
     query = {"id":airbnb_id}
-    # use primary key first
-    headers = {
-        "x-rapidapi-key":os.environ["AIRBNB_KEY_1"],
-        "x-rapidapi-host":api_params["x-rapidapi-host"]
-        }
-    response = requests.get(api_params["endpoint_availability"], headers=headers, params=query)
-
-    if response.status_code != 200:
-        print(f"Primary key error: {response.status_code}")
-        # try the second key
-        headers["x-rapidapi-key"] = os.environ["AIRBNB_KEY_2"]
-        response = requests.get(api_params["endpoint_availability"], headers=headers, params=query)
-        if response.status_code != 200:
-            raise Exception(f"Secondary key error: {response.status_code}")
+    response = _get_with_failover(get_settings().airbnb_endpoint_availability, query)
 
     response = response.json()
 
@@ -191,15 +176,182 @@ def get_airbnb_availability(results:list, checkIn:str, checkOut:str) -> bool:
 
     return is_available
 
-def main(coordinates:tuple, checkIn:str, checkOut:str, range:int=500) -> List[dict]:
+def to_stay(airbnb_details:dict, checkIn:str, checkOut:str) -> Stay:
     """
-    Searches for airbnbs and returns the listing details for each airbnb as a list of dictionaries
+    Reads a Stay straight from the listing details of get_airbnb_details
+
+    Params:
+    - airbnb_details (dict): listing details as returned by the api
+    - checkIn (str): check in date the listing was found available for
+    - checkOut (str): check out date the listing was found available for
+
+    Returns:
+    - (Stay)
+    """
+
+    return Stay(
+        accomodationId=str(airbnb_details["airbnb_id"]),
+        accomodationTitle=airbnb_details["listingTitle"],
+        city=airbnb_details["city"],
+        # is this guest rating or hotel star-level?
+        avgGuestRating=airbnb_details["starRating"],
+        ### need to get price from another airbnb api call
+        price=None,
+        checkIn=checkIn,
+        checkOut=checkOut,
+        lat=airbnb_details["listingLat"],
+        long=airbnb_details["listingLng"],
+        stayType="airbnb"
+    )
+
+def check_airbnb(airbnb_id:int, checkIn:str, checkOut:str) -> dict:
+    """
+    Checks one airbnb's calendar and, if it is available for the stay, gets its listing details.
+    Availability is checked against the listing's stored calendar, which is re-fetched once it is stale, 
+    and details come from the listing store when the listing has been fetched before.
+
+    Params:
+    - airbnb_id (int): the airbnb_id to check
+    - checkIn (str): desired check in date
+    - checkOut (str): desired check out date
+
+    Returns:
+    - (dictionary): listing details, or None if the airbnb is not available for the searched date range
+
+    Raise:
+    - if 'is_available' is returned neither True nor False
+    """
+
+    is_available = calendar_store.is_available(airbnb_id, checkIn, checkOut, fetch_calendar=get_airbnb_calendar)
+
+    if not is_available:
+        return None
+    elif is_available:
+        airbnb_details = listing_store.get_listing("airbnb", airbnb_id)
+        if airbnb_details is None:
+            airbnb_details = get_airbnb_details(airbnb_id)
+            listing_store.save_listings("airbnb", [{
+                "listing_id":airbnb_details["airbnb_id"],
+                "lat":airbnb_details["listingLat"],
+                "long":airbnb_details["listingLng"],
+                "rating":airbnb_details["starRating"],
+                "details":airbnb_details
+                }])
+        return airbnb_details
+    else:
+        raise ValueError(f""" "is_available" = {is_available} is neither True nor False""")
+
+def find_airbnbs(coordinates:tuple, range:int=500, use_store:bool=True, max_pages:int=1) -> List[dict]:
+    """
+    Finds the airbnbs around a point. Reuses the results of an earlier search covering the area if it ran within STORE_MAX_AGE_SEC,
+    otherwise pages through the search api by offset, SEARCH_PAGE_SIZE airbnbs at a time, until a page comes back short or max_pages were fetched.
+    The results are recorded in the listing store only if the last page was short, so every airbnb of the area is in them
+
+    Params:
+    - coordinates (tuple): center of search area as (lat, long)
+    - range (int): the search radius in metres
+    - use_store (bool): False always uses the search api
+    - max_pages (int): budget of search calls
+
+    Returns:
+    - (list of dictionaries): airbnbs ids and proximity, in meters, to the searched coordinates. None or empty if no airbnbs are found
+    """
+
+    if use_store:
+        stored_airbnbs = listing_store.find_search("airbnb", coordinates[0], coordinates[1], range, STORE_MAX_AGE_SEC, id_field="airbnb_id")
+        if stored_airbnbs is not None:
+            return stored_airbnbs
+
+    airbnbs = None
+    seen = set()
+    complete = False
+    # range is the search radius here, so the pages are counted with itertools
+    for page_index in itertools.islice(itertools.count(), max_pages):
+        page = get_airbnbs_near_lat_long(str(coordinates[0]), str(coordinates[1]), range=str(range), offset=page_index*SEARCH_PAGE_SIZE)
+        if page is None:
+            break
+
+        airbnbs = [] if airbnbs is None else airbnbs
+        for airbnb in page:
+            if airbnb["airbnb_id"] not in seen:
+                seen.add(airbnb["airbnb_id"])
+                airbnbs.append(airbnb)
+
+        # only a full page can have another after it
+        if len(page) < SEARCH_PAGE_SIZE:
+            complete = True
+            break
+
+    # a search cut short by the page budget leaves airbnbs of the area out, so it cannot stand in for later searches inside it
+    if complete:
+        listing_store.save_search("airbnb", coordinates[0], coordinates[1], range, airbnbs, max_age_sec=STORE_MAX_AGE_SEC)
+
+    return airbnbs
+
+def iter_airbnbs(coordinates:tuple, checkIn:str, checkOut:str, range:int=500, max_workers:int=8, use_store:bool=True, stop:threading.Event=None, max_pages:int=1) -> Iterator[Stay]:
+    """
+    Streams available airbnbs as stays as soon as each one's availability and details lookups complete.
+    Only max_workers airbnbs are looked up at a time and stop is checked before each new lookup is started,
+    so setting it skips the calendar and details calls for every airbnb not yet started, even while the consumer is not reading.
 
     Params:
     - coordinates (tuple): center of search area as (lat, long)
     - checkIn (str): desired check in date
     - checkOut (str): desired check out date
     - range (int): the search radius in metres
+    - max_workers (int): max number of airbnbs looked up at the same time
+    - use_store (bool): see find_airbnbs
+    - stop (threading.Event): set by the consumer once it has enough stays, the generator then returns without starting more lookups
+    - max_pages (int): budget of search calls, see find_airbnbs
+
+    Yields:
+    - (Stay): each available airbnb, in the order their lookups finish
+    """
+
+    airbnbs_near_address = find_airbnbs(coordinates, range, use_store, max_pages)
+    if not airbnbs_near_address:
+        print("no airbnbs found")
+        return
+
+    stop = threading.Event() if stop is None else stop
+    pending_ids = iter([airbnb["airbnb_id"] for airbnb in airbnbs_near_address])
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    in_flight = set()
+
+    try:
+        for airbnb_id in itertools.islice(pending_ids, max_workers):
+            if stop.is_set():
+                return
+            in_flight.add(executor.submit(check_airbnb, airbnb_id, checkIn, checkOut))
+
+        while len(in_flight) > 0:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                if stop.is_set():
+                    return
+                # keep the pool full, one new lookup for each one that finished
+                for airbnb_id in itertools.islice(pending_ids, 1):
+                    in_flight.add(executor.submit(check_airbnb, airbnb_id, checkIn, checkOut))
+
+                airbnb_details = future.result()
+                if airbnb_details is not None:
+                    yield to_stay(airbnb_details, checkIn, checkOut)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def main(coordinates:tuple, checkIn:str, checkOut:str, range:int=500, max_workers:int=8, use_store:bool=True, max_pages:int=1) -> List[dict]:
+    """
+    Searches for airbnbs and returns the listing details for each airbnb as a list of dictionaries.
+    The calendar and details lookups for each airbnb are fanned out over a thread pool; results keep the order of the search results.
+
+    Params:
+    - coordinates (tuple): center of search area as (lat, long)
+    - checkIn (str): desired check in date
+    - checkOut (str): desired check out date
+    - range (int): the search radius in metres
+    - max_workers (int): max number of airbnbs looked up at the same time. 1 runs the lookups sequentially
+    - use_store (bool): reuse an earlier search of the area, see find_airbnbs
+    - max_pages (int): budget of search calls, see find_airbnbs
 
     Returns: 
     - (list of dictionaries): each dictionary contains listing details for one airbnb
@@ -209,23 +361,21 @@ def main(coordinates:tuple, checkIn:str, checkOut:str, range:int=500) -> List[di
     - if 'is_available' is returned neither True nor False
     """
 
-    airbnbs_near_address = get_airbnbs_near_lat_long(str(coordinates[0]), str(coordinates[1]), range=str(range))
+    airbnbs_near_address = find_airbnbs(coordinates, range, use_store, max_pages)
     list_of_airbnbs = []
 
-    if len(airbnbs_near_address) == 0:
+    if not airbnbs_near_address:
         print("no airbnbs found")
     else:
-        for airbnb in airbnbs_near_address:
-            airbnb_id = airbnb["airbnb_id"]
-            calendar = get_airbnb_calendar(airbnb_id)
-            is_available = get_airbnb_availability(calendar, checkIn, checkOut)
-
-            if not is_available:
-                continue
-            elif is_available:
-                airbnb_details = get_airbnb_details(airbnb_id)
-                list_of_airbnbs.append(airbnb_details)
-            else:
-                raise ValueError(f""" "is_available" = {is_available} is neither True nor False""")
+        airbnb_ids = [airbnb["airbnb_id"] for airbnb in airbnbs_near_address]
+
+        if max_workers is None or max_workers <= 1:
+            results = [check_airbnb(airbnb_id, checkIn, checkOut) for airbnb_id in airbnb_ids]
+        else:
+            # executor.map yields results in submission order, so the output matches the sequential path
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(airbnb_ids))) as executor:
+                results = list(executor.map(lambda airbnb_id: check_airbnb(airbnb_id, checkIn, checkOut), airbnb_ids))
+
+        list_of_airbnbs = [airbnb_details for airbnb_details in results if airbnb_details is not None]
         
     return list_of_airbnbs
\ No newline at end of file
@@ -0,0 +1,257 @@
+import sqlite3
+import json
+import os
+import time
+import hashlib
+import inspect
+import threading
+import functools
+from typing import Callable
+
+# default location of the on-disk cache. Set TRAVEL_APP_CACHE to move it or TRAVEL_APP_CACHE_DISABLED=1 to turn it off
+CACHE_PATH = os.environ.get("TRAVEL_APP_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "travel_app", "responses.sqlite"))
+
+# max number of responses kept on disk before the least recently used ones are evicted
+MAX_ENTRIES = 50000
+
+# a hit only writes its last access time when the stored one is older than this, so most hits never write or commit
+ACCESS_REFRESH_SEC = 60*60
+
+# how long a response stays fresh for each class of endpoint, in seconds
+TTL_SECONDS = {
+    "geocode": 365*24*60*60,
+    "location": 90*24*60*60,
+    "details": 30*24*60*60,
+    "directions": 30*24*60*60,
+    "isochrone": 30*24*60*60,
+    "listings": 24*60*60,
+    "availability": 6*60*60,
+    "rates": 30*60
+}
+
+_MISS = object()
+_lock = threading.RLock()
+_connection = None
+_enabled = os.environ.get("TRAVEL_APP_CACHE_DISABLED") != "1"
+_stats = {"hits":0, "misses":0, "evictions":0}
+
+def _get_connection() -> sqlite3.Connection:
+    """
+    Opens the cache database the first time it is needed and creates the responses table
+
+    Returns:
+    - (sqlite3.Connection): connection shared by all threads, guarded by the module lock
+    """
+
+    global _connection
+
+    if _connection is None:
+        directory = os.path.dirname(CACHE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _connection = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        _connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        _connection.commit()
+
+    return _connection
+
+def _normalize(value):
+    """
+    Converts params into a canonical form so equivalent calls share a key, eg. (49.1, -122.5) and ["49.1", "-122.5"]
+
+    Params:
+    - value: any json-like params value
+
+    Returns:
+    - json serializable value
+    """
+
+    if isinstance(value, dict):
+        return {str(k):_normalize(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    elif isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    elif isinstance(value, bool) or value is None:
+        return value
+    elif isinstance(value, float):
+        return repr(round(value, 6))
+    else:
+        return str(value).strip()
+
+def make_key(endpoint:str, params:dict) -> str:
+    """
+    Builds the cache key for one request
+
+    Params:
+    - endpoint (str): name of the endpoint or client function
+    - params (dict): query params for the request
+
+    Returns:
+    - (str): hex digest of the endpoint and normalized params
+    """
+
+    payload = json.dumps([endpoint, _normalize(params)], sort_keys=True)
+
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def lookup(endpoint:str, params:dict, default=None, decode:Callable=None):
+    """
+    Looks up a fresh response in the cache
+
+    Params:
+    - endpoint (str): name of the endpoint or client function
+    - params (dict): query params for the request
+    - default: returned when there is no fresh response
+    - decode (function): turns the value read back from json into the type that was stored, eg. tuple. Defaults to returning it as read
+
+    Returns:
+    - the cached response, or default on a miss
+    """
+
+    if not _enabled:
+        return default
+
+    key = make_key(endpoint, params)
+    now = time.time()
+
+    with _lock:
+        connection = _get_connection()
+        row = connection.execute("SELECT value, expires_at, last_access FROM responses WHERE key = ?", (key,)).fetchone()
+
+        if row is None or row[1] < now:
+            if row is not None:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                connection.commit()
+            _stats["misses"] += 1
+            return default
+
+        # eviction only needs the order of last access to the hour, not the exact time of every hit
+        if now - row[2] > ACCESS_REFRESH_SEC:
+            connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            connection.commit()
+        _stats["hits"] += 1
+
+    value = json.loads(row[0])
+
+    return value if decode is None else decode(value)
+
+def store(endpoint:str, params:dict, value, ttl_class:str) -> None:
+    """
+    Stores a response in the cache and evicts the least recently used responses if the cache is full
+
+    Params:
+    - endpoint (str): name of the endpoint or client function
+    - params (dict): query params for the request
+    - value: json serializable response
+    - ttl_class (str): key of TTL_SECONDS that sets how long the response stays fresh
+    """
+
+    if not _enabled:
+        return
+
+    key = make_key(endpoint, params)
+    now = time.time()
+
+    with _lock:
+        connection = _get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO responses (key, endpoint, value, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, endpoint, json.dumps(value), now + TTL_SECONDS[ttl_class], now)
+        )
+
+        n_entries = connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if n_entries > MAX_ENTRIES:
+            # evict down to 90% of capacity so we are not evicting on every insert
+            n_evict = n_entries - int(MAX_ENTRIES*0.9)
+            connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (n_evict,)
+            )
+            _stats["evictions"] += n_evict
+
+        connection.commit()
+
+def cached(ttl_class:str, decode:Callable=None) -> Callable:
+    """
+    Decorator that caches the return value of an api client function, keyed on the function name and its arguments.
+    Calls that raise are not cached.
+
+    Params:
+    - ttl_class (str): key of TTL_SECONDS that sets how long responses stay fresh
+    - decode (function): see lookup, so a hit returns the same type as the function, eg. tuple for coordinates
+
+    Returns:
+    - (function): decorator
+    """
+
+    if ttl_class not in TTL_SECONDS:
+        raise ValueError(f"Unknown cache ttl class: {ttl_class}")
+
+    def decorator(func:Callable) -> Callable:
+        endpoint = f"{func.__module__}.{func.__qualname__}"
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = dict(bound.arguments)
+
+            value = lookup(endpoint, params, default=_MISS, decode=decode)
+            if value is _MISS:
+                value = func(*args, **kwargs)
+                store(endpoint, params, value, ttl_class)
+
+            return value
+
+        return wrapper
+
+    return decorator
+
+def stats() -> dict:
+    """
+    Hit, miss and eviction counters for this process plus the number of responses on disk
+
+    Returns:
+    - (dict): cache counters
+    """
+
+    with _lock:
+        counters = dict(_stats)
+        counters["entries"] = _get_connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0] if _enabled else 0
+
+    return counters
+
+def set_enabled(enabled:bool) -> None:
+    """
+    Turns the cache on or off for this process
+
+    Params:
+    - enabled (bool): False makes every lookup a miss and skips writes
+    """
+
+    global _enabled
+    _enabled = enabled
+
+def clear() -> None:
+    """
+    Deletes every cached response and resets the counters
+    """
+
+    with _lock:
+        connection = _get_connection()
+        connection.execute("DELETE FROM responses")
+        connection.commit()
+        for counter in _stats:
+            _stats[counter] = 0
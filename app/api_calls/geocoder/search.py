@@ -1,8 +1,18 @@
-import requests
+from api_calls import sessions
 from requests.structures import CaseInsensitiveDict
-import os
-from typing import List
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Callable
+from api_calls import cache
+from api_calls import quota
+from api_calls.cache import cached
+from api_calls.singleflight import single_flight
 
+# cache endpoint holding coordinates for every normalized address geocoded so far
+GAZETTEER_ENDPOINT = "geocoder.gazetteer"
+
+@cached("geocode", decode=tuple)
+@single_flight
 def get_geocoded_address(address:str) -> tuple:
     """
     Gets the lat and long coordinates for a given address.
@@ -14,12 +24,12 @@ def get_geocoded_address(address:str) -> tuple:
     - (tuple): the lat and long coordinates
     """
     address = address.replace(" ", "%20")
-    apiKey = os.environ["GEOAPIFY_KEY"]
+    apiKey = quota.acquire("geoapify")
     url = f"https://api.geoapify.com/v1/geocode/search?text={address}&apiKey={apiKey}"
     headers = CaseInsensitiveDict()
     headers["Accept"] = "application/json"
 
-    response = requests.get(url, headers=headers)
+    response = sessions.get(url, headers=headers)
 
     if response.status_code!=200:
         print(response.json())
@@ -32,9 +42,62 @@ def get_geocoded_address(address:str) -> tuple:
 
     return lat, lon
 
+def normalize_address(address:str) -> str:
+    """
+    Puts an address in a canonical form so the same place written differently is geocoded once,
+    eg. "1709 F Street,  Bellingham WA" and "1709 f street bellingham wa"
+
+    Params:
+    - address (str): free form address
+
+    Returns:
+    - (str): lower case address with punctuation removed and whitespace collapsed
+    """
+
+    address = re.sub(r"[,;.#]", " ", address.lower())
+
+    return " ".join(address.split())
+
+def get_batch_geocoded_addresses(addresses:list, geocoder:Callable[[str], tuple]=get_geocoded_address, max_workers:int=8) -> List[tuple]:
+    """
+    Geocodes many addresses at once. Addresses are normalized and deduplicated, repeats are served from the local gazetteer
+    and only the misses are sent to the geocoder, concurrently. The gazetteer only holds geoapify's coordinates,
+    so a stand-in geocoder neither reads it nor writes to it.
+
+    Params:
+    - addresses (list): multiple freeform addresses
+    - geocoder (function): takes one address and returns its (lat, long). Defaults to geoapify, a local stand-in can be passed instead
+    - max_workers (int): max number of addresses geocoded at the same time
+
+    Returns:
+    - (list of tuples): coordinates for each address, in the order of addresses
+    """
+
+    normalized_addresses = [normalize_address(address) for address in addresses]
+    unique_addresses = list(dict.fromkeys(normalized_addresses))
+    use_gazetteer = geocoder is get_geocoded_address
+
+    coordinates = {}
+    misses = []
+    for address in unique_addresses:
+        coordinate = cache.lookup(GAZETTEER_ENDPOINT, {"address":address}, decode=tuple) if use_gazetteer else None
+        if coordinate is None:
+            misses.append(address)
+        else:
+            coordinates[address] = coordinate
+
+    if len(misses) > 0:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(misses)))) as executor:
+            for address, coordinate in zip(misses, executor.map(geocoder, misses)):
+                coordinates[address] = tuple(coordinate)
+                if use_gazetteer:
+                    cache.store(GAZETTEER_ENDPOINT, {"address":address}, list(coordinate), "geocode")
+
+    return [coordinates[address] for address in normalized_addresses]
+
 def get_mulitple_geocoded_addresses(addresses:list) -> List[tuple]:
     """
-    Coordinates for a list of addresses
+    Coordinates for a list of addresses, see get_batch_geocoded_addresses
     
     Params:
     - addresses (list): multiple freeform addresses
@@ -42,9 +105,5 @@ def get_mulitple_geocoded_addresses(addresses:list) -> List[tuple]:
     Returns:
     - (list of tuples): list of coordinates for each address
     """
-    geocoded_addresses = []
-    for address in addresses:
-        geocoded_address= get_geocoded_address(address)
-        geocoded_addresses.append(geocoded_address)
 
-    return geocoded_addresses
\ No newline at end of file
+    return get_batch_geocoded_addresses(addresses)
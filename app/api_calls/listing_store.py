@@ -0,0 +1,326 @@
+import sqlite3
+import json
+import os
+import time
+import threading
+import numpy as np
+from typing import List
+
+# every listing fetched from a provider is kept here. Set TRAVEL_APP_LISTINGS to move it
+LISTINGS_PATH = os.environ.get("TRAVEL_APP_LISTINGS", os.path.join(os.path.expanduser("~"), ".cache", "travel_app", "listings.sqlite"))
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = np.radians(1)*EARTH_RADIUS_KM
+
+_lock = threading.RLock()
+_connection = None
+# spatial index over every stored listing, rebuilt on the next query after listings are saved
+_index = None
+
+def _get_connection() -> sqlite3.Connection:
+    """
+    Opens the listings database the first time it is needed and creates the listings and searches tables
+
+    Returns:
+    - (sqlite3.Connection): connection shared by all threads, guarded by the module lock
+    """
+
+    global _connection
+
+    if _connection is None:
+        directory = os.path.dirname(LISTINGS_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _connection = sqlite3.connect(LISTINGS_PATH, check_same_thread=False)
+        _connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS listings (
+                provider TEXT NOT NULL,
+                listing_id TEXT NOT NULL,
+                lat REAL NOT NULL,
+                long REAL NOT NULL,
+                rating REAL,
+                details TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (provider, listing_id)
+            )
+            """
+        )
+        _connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS searches (
+                provider TEXT NOT NULL,
+                lat REAL NOT NULL,
+                long REAL NOT NULL,
+                radius_m REAL NOT NULL,
+                results TEXT NOT NULL,
+                searched_at REAL NOT NULL
+            )
+            """
+        )
+        # find_search reads both tables by provider and a latitude band
+        _connection.execute("CREATE INDEX IF NOT EXISTS searches_by_lat ON searches (provider, lat)")
+        _connection.execute("CREATE INDEX IF NOT EXISTS listings_by_lat ON listings (provider, lat)")
+        _connection.commit()
+
+    return _connection
+
+def _distances_m(lats, longs, lat:float, long:float) -> np.ndarray:
+    """
+    Great-circle distance from many points to one point
+
+    Params:
+    - lats (array-like): latitudes of the points
+    - longs (array-like): longitudes of the points
+    - lat (float): latitude of the point to measure to
+    - long (float): longitude of the point to measure to
+
+    Returns:
+    - (np.ndarray): distances in metres
+    """
+
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    longs = np.radians(np.asarray(longs, dtype=np.float64))
+    a = np.sin((lats-np.radians(lat))/2)**2 + np.cos(lats)*np.cos(np.radians(lat))*np.sin((longs-np.radians(long))/2)**2
+
+    return 2*EARTH_RADIUS_KM*np.arcsin(np.sqrt(a))*1000
+
+def save_search(provider:str, lat:float, long:float, radius_m:float, results:List[dict], max_age_sec:float=None) -> None:
+    """
+    Records every listing a provider's search api returned for an area, including listings that were never available,
+    so the area can be searched again locally without missing any of them. Only save searches that returned every listing in the area,
+    a search cut short by the api's page size would hide the rest from every later search it covers
+
+    Params:
+    - provider (str): airbnb or priceline
+    - lat (float): latitude of the search center
+    - long (float): longitude of the search center
+    - radius_m (float): search radius in metres
+    - results (list of dictionaries): search results, each with the provider's id field and distance
+    - max_age_sec (float): the provider's searches older than this are deleted, see find_search. Defaults to keeping them
+    """
+
+    now = time.time()
+    with _lock:
+        connection = _get_connection()
+        connection.execute(
+            "INSERT INTO searches VALUES (?, ?, ?, ?, ?, ?)",
+            (provider, float(lat), float(long), float(radius_m), json.dumps(results), now)
+        )
+        if max_age_sec is not None:
+            connection.execute("DELETE FROM searches WHERE provider = ? AND searched_at < ?", (provider, now - max_age_sec))
+        connection.commit()
+
+def find_search(provider:str, lat:float, long:float, radius_m:float, max_age_sec:float, id_field:str) -> List[dict]:
+    """
+    Finds a recent search whose area covers the requested area and returns its results inside the requested radius.
+    Only the searches whose centre is close enough in latitude to cover the area are read, and only the covering ones' results.
+    Stored listings are placed with query_radius, a result whose details were never fetched only when it is certainly inside
+
+    Params:
+    - provider (str): airbnb or priceline
+    - lat (float): latitude of the search center
+    - long (float): longitude of the search center
+    - radius_m (float): search radius in metres
+    - max_age_sec (float): ignore searches older than this
+    - id_field (str): key of the provider's id in each search result, eg. airbnb_id
+
+    Returns:
+    - (list of dictionaries): the covering search's results inside the radius, nearest first, with distance in metres from the requested center
+    (an upper bound for listings whose details were never fetched). None if no recent search covers the area,
+    or if every covering search has a result that cannot be placed inside or outside the radius
+    """
+
+    # a covering search's centre is at most its radius less the requested radius away, so at most that far north or south
+    m_per_degree_lat = KM_PER_DEGREE_LAT*1000
+    with _lock:
+        rows = _get_connection().execute(
+            """
+            SELECT rowid, lat, long, radius_m FROM searches
+            WHERE provider = ? AND searched_at > ? AND radius_m >= ? AND ABS(lat - ?)*? <= radius_m - ?
+            ORDER BY searched_at DESC
+            """,
+            (provider, time.time() - max_age_sec, float(radius_m), float(lat), m_per_degree_lat, float(radius_m))
+        ).fetchall()
+
+    if len(rows) == 0:
+        return None
+
+    centers = np.array([row[1:] for row in rows], dtype=np.float64)
+    offsets_m = _distances_m(centers[:, 0], centers[:, 1], lat, long)
+    covering = np.flatnonzero(offsets_m + radius_m <= centers[:, 2])
+    if len(covering) == 0:
+        return None
+
+    # stored listings inside the requested area, answered by the spatial index
+    nearby = {listing["listing_id"]:listing["distance"] for listing in query_radius(lat, long, radius_m, provider)}
+
+    for position in covering:
+        offset_m = float(offsets_m[position])
+        with _lock:
+            connection = _get_connection()
+            results = json.loads(connection.execute("SELECT results FROM searches WHERE rowid = ?", (rows[position][0],)).fetchone()[0])
+            result_ids = [str(result[id_field]) for result in results]
+            stored = {
+                row[0] for row in connection.execute(
+                    f"SELECT listing_id FROM listings WHERE provider = ? AND listing_id IN ({', '.join('?'*len(result_ids))})",
+                    [provider] + result_ids
+                )
+            } if len(result_ids) > 0 else set()
+
+        # the covering search can be wider than the requested area, keep only the listings inside it
+        inside = []
+        for result, result_id in zip(results, result_ids):
+            if result_id in nearby:
+                inside.append(dict(result, distance=nearby[result_id]))
+            elif result_id in stored or float(result["distance"]) - offset_m > radius_m:
+                # outside, either placed by its stored coordinates or too far from the old center to be inside
+                continue
+            elif float(result["distance"]) + offset_m <= radius_m:
+                # never fetched so its position is unknown, but it is no further from the requested center than from the old one plus the offset
+                inside.append(dict(result, distance=float(result["distance"]) + offset_m))
+            else:
+                # could be inside or outside, this search cannot stand in for the requested one
+                break
+        else:
+            return sorted(inside, key=lambda result: result["distance"])
+
+    return None
+
+def save_listings(provider:str, listings:List[dict]) -> None:
+    """
+    Stores the static details of listings, replacing any earlier copy
+
+    Params:
+    - provider (str): airbnb or priceline
+    - listings (list of dictionaries): each with listing_id, lat, long, rating and details (dict of static fields)
+    """
+
+    global _index
+
+    if len(listings) == 0:
+        return
+
+    now = time.time()
+    rows = [
+        (provider, str(listing["listing_id"]), float(listing["lat"]), float(listing["long"]), listing["rating"], json.dumps(listing["details"]), now)
+        for listing in listings
+        ]
+
+    with _lock:
+        connection = _get_connection()
+        connection.executemany("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        connection.commit()
+        _index = None
+
+def get_listing(provider:str, listing_id) -> dict:
+    """
+    Gets the stored details of one listing
+
+    Params:
+    - provider (str): airbnb or priceline
+    - listing_id: provider's id for the listing
+
+    Returns:
+    - (dict): the details saved for the listing, None if it has never been fetched
+    """
+
+    with _lock:
+        row = _get_connection().execute(
+            "SELECT details FROM listings WHERE provider = ? AND listing_id = ?", (provider, str(listing_id))
+        ).fetchone()
+
+    return None if row is None else json.loads(row[0])
+
+def _get_index() -> dict:
+    """
+    Builds the STRtree over every stored listing the first time it is needed after a save
+
+    Returns:
+    - (dict): the tree plus provider, listing_id, lat, long, rating and fetched_at arrays in tree order
+    """
+
+    global _index
+
+    import shapely
+    from shapely.strtree import STRtree
+
+    with _lock:
+        if _index is None:
+            rows = _get_connection().execute("SELECT provider, listing_id, lat, long, rating, fetched_at FROM listings").fetchall()
+            columns = list(zip(*rows)) if len(rows) > 0 else [[]]*6
+            lats = np.array(columns[2], dtype=np.float64)
+            longs = np.array(columns[3], dtype=np.float64)
+            _index = {
+                "tree":STRtree(shapely.points(longs, lats)),
+                "provider":np.array(columns[0], dtype=object),
+                "listing_id":np.array(columns[1], dtype=object),
+                "lat":lats,
+                "long":longs,
+                "rating":np.array([np.nan if rating is None else rating for rating in columns[4]], dtype=np.float64),
+                "fetched_at":np.array(columns[5], dtype=np.float64)
+            }
+
+        return _index
+
+def _to_listings(index:dict, positions:np.ndarray) -> List[dict]:
+    """
+    Turns positions in the index into listing summaries
+
+    Params:
+    - index (dict): see _get_index
+    - positions (np.ndarray): positions of matching listings
+
+    Returns:
+    - (list of dictionaries): provider, listing_id, lat, long, rating and fetched_at of each listing
+    """
+
+    return [
+        {
+            "provider":index["provider"][position],
+            "listing_id":index["listing_id"][position],
+            "lat":float(index["lat"][position]),
+            "long":float(index["long"][position]),
+            "rating":float(index["rating"][position]),
+            "fetched_at":float(index["fetched_at"][position])
+        }
+        for position in positions
+    ]
+
+def query_radius(lat:float, long:float, radius_m:float, provider:str=None) -> List[dict]:
+    """
+    Finds stored listings within a radius of a point without calling any provider, eg. to place the results of a covering search, see find_search
+
+    Params:
+    - lat (float): latitude of the center
+    - long (float): longitude of the center
+    - radius_m (float): search radius in metres
+    - provider (str): only return this provider's listings. Defaults to every provider
+
+    Returns:
+    - (list of dictionaries): listings nearest first, see _to_listings, with distance in metres added
+    """
+
+    import shapely
+
+    index = _get_index()
+    # padded a little so the box never cuts into the circle
+    radius_km = radius_m/1000*1.01
+    lat_pad = radius_km/KM_PER_DEGREE_LAT
+    long_pad = radius_km/(KM_PER_DEGREE_LAT*max(np.cos(np.radians(lat)), 1e-6))
+
+    # the tree narrows the search to a bounding box, then the exact great-circle distance decides
+    positions = index["tree"].query(shapely.box(long-long_pad, lat-lat_pad, long+long_pad, lat+lat_pad))
+
+    distances_m = _distances_m(index["lat"][positions], index["long"][positions], lat, long)
+
+    within = distances_m <= radius_m
+    order = np.argsort(distances_m[within], kind="stable")
+    positions = positions[within][order]
+    distances_m = distances_m[within][order]
+
+    listings = _to_listings(index, positions)
+    for listing, distance_m in zip(listings, distances_m):
+        listing["distance"] = float(distance_m)
+
+    return [listing for listing in listings if provider is None or listing["provider"] == provider]
@@ -1,8 +1,15 @@
-import requests
-import os
-import json
+from api_calls import sessions
+from api_calls import quota
+from api_calls.cache import cached
+from api_calls.settings import get_settings
+from api_calls.singleflight import single_flight
+import numpy as np
 from typing import List
 
+KM_PER_DEGREE_LAT = 111.32
+
+@cached("directions")
+@single_flight
 def get_driving_directions(start: tuple, finish: tuple) -> dict:
     """
     Get driving directions between two coordinates.
@@ -17,19 +24,232 @@ def get_driving_directions(start: tuple, finish: tuple) -> dict:
 
     ENDPOINT = "https://api.openrouteservice.org/v2/directions/driving-car/geojson"
     
-    with open("api_calls/openroute_service/api_params.json", "r") as f:
-        headers = json.load(f)
+    headers = dict(get_settings().openroute_headers)
         
-    headers["Authorization"] = os.environ["OPENROUTE_KEY"]
+    headers["Authorization"] = quota.acquire("openroute_directions")
     coordinates = [[start[1], start[0]], [finish[1], finish[0]]]
     print(f"Coordinates reversed: {coordinates}")
-    response = requests.post(ENDPOINT, json={"coordinates":coordinates}, headers=headers)
+    response = sessions.post(ENDPOINT, json={"coordinates":coordinates}, headers=headers)
 
     if response.status_code!=200:
         raise Exception(f"Error getting driving directions for {coordinates}:\n{response.status_code}")
 
     return response.json()
 
+@cached("directions")
+@single_flight
+def get_duration_matrix(sources:List[tuple], destinations:List[tuple]) -> List[List[float]]:
+    """
+    Get driving durations from every source to every destination in one request.
+
+    Params:
+    - sources (list of tuples): lat long coordinates to drive from
+    - destinations (list of tuples): lat long coordinates to drive to
+
+    Returns:
+    - (list of lists): durations in seconds indexed as [source][destination]. None where no route was found
+    """
+
+    ENDPOINT = "https://api.openrouteservice.org/v2/matrix/driving-car"
+
+    headers = dict(get_settings().openroute_headers)
+
+    headers["Authorization"] = quota.acquire("openroute_matrix")
+    # openrouteservice takes a single list of long lat locations and indexes into it for sources and destinations
+    locations = [[lat_long[1], lat_long[0]] for lat_long in list(sources) + list(destinations)]
+    query = {
+        "locations":locations,
+        "sources":list(range(len(sources))),
+        "destinations":list(range(len(sources), len(locations))),
+        "metrics":["duration"]
+        }
+    response = sessions.post(ENDPOINT, json=query, headers=headers)
+
+    if response.status_code!=200:
+        raise Exception(f"Error getting duration matrix for {locations}:\n{response.status_code}")
+
+    return response.json()["durations"]
+
+class RouteIndex:
+    """
+    A directions response parsed once into arrays so any point in the drive is found by binary search instead of walking the steps.
+    The response itself is never modified.
+
+    Attributes:
+    - coordinates (np.ndarray): n x 2 contiguous array of the route geometry as (long, lat)
+    - step_start_sec (np.ndarray): driving time at the start of each step, across every segment in order
+    - step_end_sec (np.ndarray): cumulative driving time at the end of each step
+    - step_end_m (np.ndarray): cumulative driving distance in metres at the end of each step
+    - step_way_points (np.ndarray): n_steps x 2 indexes of each step's first and last coordinate
+    - vertex_m (np.ndarray): cumulative length of the geometry at each coordinate, used to place a point inside a step
+    - total_duration_sec (float)
+    - total_distance_m (float)
+    """
+
+    def __init__(self, directions:dict):
+        """
+        Params:
+        - directions (dict): driving directions from get_driving_directions
+        """
+
+        feature = directions["features"][0]
+        steps = [step for segment in feature["properties"]["segments"] for step in segment["steps"]]
+
+        self.coordinates = np.ascontiguousarray(feature["geometry"]["coordinates"], dtype=np.float64)[:, :2]
+        durations = np.array([step["duration"] for step in steps], dtype=np.float64)
+        distances = np.array([step["distance"] for step in steps], dtype=np.float64)
+        self.step_end_sec = np.cumsum(durations)
+        self.step_start_sec = self.step_end_sec - durations
+        self.step_end_m = np.cumsum(distances)
+        self.step_way_points = np.array([step["way_points"] for step in steps], dtype=np.int64).reshape(-1, 2)
+        self.total_duration_sec = float(self.step_end_sec[-1]) if len(steps) > 0 else 0.0
+        self.total_distance_m = float(self.step_end_m[-1]) if len(steps) > 0 else 0.0
+
+        # flat earth distance between neighbouring coordinates is plenty to share a step's time out along its shape
+        deltas = np.diff(self.coordinates, axis=0)
+        deltas[:, 0] *= np.cos(np.radians(self.coordinates[:-1, 1]))
+        self.vertex_m = np.concatenate([[0.0], np.cumsum(np.hypot(deltas[:, 0], deltas[:, 1])*KM_PER_DEGREE_LAT*1000)])
+
+    def step_at(self, elapsed_sec:float) -> int:
+        """
+        Finds the step being driven after some time
+
+        Params:
+        - elapsed_sec (float): driving time since the start of the route
+
+        Returns:
+        - (int): index of the step, the last step once the route is finished
+        """
+
+        return int(min(np.searchsorted(self.step_end_sec, elapsed_sec, side="left"), len(self.step_end_sec) - 1))
+
+    def _locate(self, elapsed_sec:float) -> tuple:
+        """
+        Where the car is after some time of driving, interpolated along the shape of the step being driven
+
+        Params:
+        - elapsed_sec (float): driving time since the start of the route
+
+        Returns:
+        - (tuple): index of the last coordinate reached and the point as an array of (long, lat)
+        """
+
+        step = self.step_at(elapsed_sec)
+        first, last = self.step_way_points[step]
+        duration_sec = self.step_end_sec[step] - self.step_start_sec[step]
+        share = 1.0 if duration_sec <= 0 else min(max((elapsed_sec - self.step_start_sec[step])/duration_sec, 0.0), 1.0)
+
+        # the distance along the geometry the car has reached, then the two coordinates either side of it
+        target_m = self.vertex_m[first] + share*(self.vertex_m[last] - self.vertex_m[first])
+        after = int(min(max(np.searchsorted(self.vertex_m[first:last+1], target_m, side="left") + first, first + 1), last))
+        if after <= first:
+            return first, self.coordinates[first].copy()
+
+        before = after - 1
+        edge_m = self.vertex_m[after] - self.vertex_m[before]
+        weight = 0.0 if edge_m <= 0 else (target_m - self.vertex_m[before])/edge_m
+
+        return before, self.coordinates[before] + weight*(self.coordinates[after] - self.coordinates[before])
+
+    def coordinates_at(self, elapsed_sec:float) -> tuple:
+        """
+        Where the car is after some time of driving, interpolated along the shape of the step being driven
+
+        Params:
+        - elapsed_sec (float): driving time since the start of the route
+
+        Returns:
+        - (tuple): lat, long
+        """
+
+        _, (long, lat) = self._locate(elapsed_sec)
+
+        return (float(lat), float(long))
+
+    def line_between(self, start_sec:float, end_sec:float) -> np.ndarray:
+        """
+        The part of the route driven between two times
+
+        Params:
+        - start_sec (float): driving time since the start of the route
+        - end_sec (float): later driving time since the start of the route
+
+        Returns:
+        - (np.ndarray): n x 2 array of (long, lat) from the start point to the end point following the road
+        """
+
+        start_before, start_point = self._locate(start_sec)
+        end_before, end_point = self._locate(end_sec)
+
+        return np.vstack([start_point, self.coordinates[start_before+1:end_before+1], end_point])
+
+    def step_end_coordinates(self, step:int) -> tuple:
+        """
+        Coordinates where a step finishes
+
+        Params:
+        - step (int): index of the step
+
+        Returns:
+        - (tuple): lat, long
+        """
+
+        long, lat = self.coordinates[self.step_way_points[step][1]]
+
+        return (float(lat), float(long))
+
+    def cut_points(self, max_driving_hours_per_day:float, interpolate:bool=False) -> List[dict]:
+        """
+        Works out every overnight stop with one binary search per night
+
+        Params:
+        - max_driving_hours_per_day (float): length of time allowed to drive between sleep stops
+        - interpolate (bool): stop exactly when the daily limit is reached, part way through a step.
+        False ends each day on the last whole step before the limit, like get_end_of_day_step
+
+        Returns:
+        - (list of dictionaries): see get_overnight_cut_points
+
+        Raise:
+        - ValueError if the daily limit is not positive, no day could ever end
+        """
+
+        if max_driving_hours_per_day <= 0:
+            raise ValueError(f"Daily driving limit must be positive, got {max_driving_hours_per_day} hours")
+
+        driving_limit_sec = max_driving_hours_per_day*60*60
+        cut_points = []
+        day_start_sec = 0.0
+
+        while self.total_duration_sec - day_start_sec > driving_limit_sec:
+            if interpolate:
+                cut_sec = day_start_sec + driving_limit_sec
+                coordinates = self.coordinates_at(cut_sec)
+                distance_m = float(np.interp(cut_sec, np.concatenate([[0.0], self.step_end_sec]), np.concatenate([[0.0], self.step_end_m])))
+            else:
+                # the last step that ends within the limit, or if even the first step of the day is longer than the limit, that step
+                step = int(np.searchsorted(self.step_end_sec, day_start_sec + driving_limit_sec, side="right")) - 1
+                if step < 0 or self.step_end_sec[step] <= day_start_sec:
+                    step = int(np.searchsorted(self.step_end_sec, day_start_sec, side="right"))
+                cut_sec = float(self.step_end_sec[step])
+                if cut_sec >= self.total_duration_sec:
+                    # the last step alone is longer than the limit, it is driven in one day and ends at the finish
+                    break
+                coordinates = self.step_end_coordinates(step)
+                distance_m = float(self.step_end_m[step])
+
+            cut_points.append(
+                {
+                    "coordinates":coordinates,
+                    "elapsed_time_sec":cut_sec,
+                    "driving_time_sec":cut_sec - day_start_sec,
+                    "distance_m":distance_m
+                }
+            )
+            day_start_sec = cut_sec
+
+        return cut_points
+
 def get_end_of_day_step(segment:dict, max_driving_hours_per_day:float) -> dict:
     """
     Operates on one segment of directions. 
@@ -58,8 +278,8 @@ def get_end_of_day_step(segment:dict, max_driving_hours_per_day:float) -> dict:
         # if we have just passed the driving limit with this step, use the previous step as the end of day step
         if time_elapsed_sec > driving_limit_sec: 
 
-            # get the previous step
-            prev_step = segment["steps"][step_number-1]
+            # get the previous step, copied so the directions response is not modified
+            prev_step = dict(segment["steps"][step_number-1])
             prev_step["elapsed_time_sec"] = time_elapsed_sec-step["duration"]
 
             # driving duration remaining between the previous step and the daily limit
@@ -75,6 +295,26 @@ def get_end_of_day_step(segment:dict, max_driving_hours_per_day:float) -> dict:
 
     return s
 
+def get_overnight_cut_points(directions, max_driving_hours_per_day:float, interpolate:bool=False) -> List[dict]:
+    """
+    Works out every overnight stop for the whole trip from a single directions response.
+    Each day ends on the last step before the daily limit is passed and the next day's driving starts from that step.
+    A step longer than the daily limit is still driven in one day.
+
+    Params:
+    - directions (dict or RouteIndex): driving directions from start to finish, or the RouteIndex already built from them
+    - max_driving_hours_per_day (float): length of time allowed to drive between sleep stops
+    - interpolate (bool): stop exactly at the daily limit, part way through a step
+
+    Returns:
+    - (list of dictionaries): one per night in chronological order with the cut's coordinates (lat, long), 
+    elapsed_time_sec since the trip start, driving_time_sec for that day and distance_m since the trip start. Empty if the trip fits in one day
+    """
+
+    route_index = directions if isinstance(directions, RouteIndex) else RouteIndex(directions)
+
+    return route_index.cut_points(max_driving_hours_per_day, interpolate)
+
 def get_coordinates_from_waypoints(step: dict, route_geometry: list) -> List[tuple]:
     """
     Get the start and end coordinates for a single driving step
@@ -1,32 +1,50 @@
-import requests
-import os
-from shapely.geometry import Polygon, Point
+from api_calls import sessions
+from api_calls import quota
+from api_calls import cache
+from api_calls.cache import cached
+from api_calls.singleflight import single_flight
+import numpy as np
+from typing import List
 #import pointpats 
 
-def request_isochrone(coordinates:tuple, driving_times:list) -> dict:
+KM_PER_DEGREE_LAT = 111.32
+
+# openrouteservice limits for one isochrone request
+MAX_LOCATIONS_PER_REQUEST = 5
+MAX_RANGES_PER_REQUEST = 10
+
+# isochrones are cached per tile: location rounded to 2 decimals (about 1 km) and range rounded to the minute
+TILE_DECIMALS = 2
+TILE_RANGE_SEC = 60
+TILE_ENDPOINT = "openroute_service.isochrone_tile"
+
+@cached("isochrone")
+@single_flight
+def request_isochrones(locations:List[tuple], driving_times:list) -> dict:
     """
-    Pass in one set of coordinates to get an area that is accessible within a given driving time.
+    Get the areas that are accessible from several locations within several driving times in one call.
+    Every driving time is applied to every location.
 
     Params:
-    coordinates (tuple): tuple of(long lat)
-    driving_time (float): length of driving time in hours to define the boundaries of the isochrone.
+    locations (list of tuples): up to MAX_LOCATIONS_PER_REQUEST tuples of (long, lat)
+    driving_times (list): up to MAX_RANGES_PER_REQUEST driving times in hours
 
     Returns:
-    - dict of isochrone geometry objects
+    - dict of isochrone geometry objects. Each feature's properties hold the group_index of its location and its range value in seconds
     """
 
     driving_times_seconds = [hrs*60*60 for hrs in driving_times]
     url = "https://api.openrouteservice.org/v2/isochrones/driving-car"
     query = {
-        "locations":[list(coordinates)], 
+        "locations":[list(coordinates) for coordinates in locations], 
         "range":driving_times_seconds
         }
     headers = {
         'Accept': 'application/json, application/geo+json, application/gpx+xml, img/png; charset=utf-8',
-        'Authorization': os.environ["OPENROUTE_KEY"],
+        'Authorization': quota.acquire("openroute_isochrone"),
         'Content-Type': 'application/json; charset=utf-8'
     }
-    call = requests.post(url, json=query, headers=headers)
+    call = sessions.post(url, json=query, headers=headers)
     
     if call.status_code!=200:
         print(call.json())
@@ -36,24 +54,229 @@ def request_isochrone(coordinates:tuple, driving_times:list) -> dict:
 
     return call.json()
 
-def is_in_isochrone(coordinates: tuple, isochrone: dict) -> bool:
+def request_isochrone(coordinates:tuple, driving_times:list) -> dict:
+    """
+    Pass in one set of coordinates to get an area that is accessible within a given driving time.
+
+    Params:
+    coordinates (tuple): tuple of(long lat)
+    driving_time (float): length of driving time in hours to define the boundaries of the isochrone.
+
+    Returns:
+    - dict of isochrone geometry objects
+    """
+
+    return request_isochrones([coordinates], driving_times)
+
+class Isochrone:
+    """
+    An isochrone parsed once into a single prepared shapely geometry so it can be queried many times.
+    Covers every feature in the response and every ring of every polygon, so holes and multi-part areas are respected.
+
+    Attributes:
+    - geometry (shapely geometry): union of the isochrone's areas in long, lat
+    - bounds (tuple): (min long, min lat, max long, max lat)
+    """
+
+    def __init__(self, geometry):
+        import shapely
+
+        self.geometry = geometry
+        # prepared geometries build their spatial index once, making repeated contains checks much faster
+        shapely.prepare(self.geometry)
+        self.bounds = geometry.bounds
+
+    @classmethod
+    def from_response(cls, isochrone:dict, value:float=None, group_index:int=None) -> "Isochrone":
+        """
+        Parses the response of an isochrone api call
+
+        Params:
+        - isochrone (dict): dict object returned from isochrone api call
+        - value (float): only keep the features for this range, in seconds. Defaults to all ranges
+        - group_index (int): only keep the features for this location of a multi-location request. Defaults to all locations
+
+        Returns:
+        - (Isochrone)
+        """
+
+        import shapely
+        from shapely.geometry import shape
+
+        polygons = []
+        for feature in isochrone["features"]:
+            properties = feature.get("properties", {})
+            if value is not None and properties.get("value") != value:
+                continue
+            if group_index is not None and properties.get("group_index") != group_index:
+                continue
+            polygons.append(shape(feature["geometry"]))
+
+        return cls(shapely.union_all(polygons))
+
+    def contains(self, coordinates:tuple) -> bool:
+        """
+        Determines if one set of coordinates is within the isochrone
+
+        Params:
+        - coordinates (tuple): tuple of (long, lat)
+
+        Returns:
+        - (bool)
+        """
+
+        return bool(self.contains_many(np.asarray([coordinates], dtype=np.float64))[0])
+
+    def contains_many(self, coords:np.ndarray) -> np.ndarray:
+        """
+        Determines which of many coordinates are within the isochrone in one vectorized call
+
+        Params:
+        - coords (np.ndarray): n x 2 array of (long, lat)
+
+        Returns:
+        - (np.ndarray): n booleans
+        """
+
+        import shapely
+
+        coords = np.asarray(coords, dtype=np.float64)
+        lons = coords[:, 0]
+        lats = coords[:, 1]
+        min_lon, min_lat, max_lon, max_lat = self.bounds
+
+        # cheap bounding box check first, only the points inside the box reach the polygon test
+        inside = (lons >= min_lon) & (lons <= max_lon) & (lats >= min_lat) & (lats <= max_lat)
+        inside[inside] = shapely.contains_xy(self.geometry, lons[inside], lats[inside])
+
+        return inside
+
+    @property
+    def area_km2(self) -> float:
+        """
+        Approximate area of the isochrone in square kilometres
+        """
+
+        min_lon, min_lat, max_lon, max_lat = self.bounds
+        km_per_degree_lon = KM_PER_DEGREE_LAT*np.cos(np.radians((min_lat+max_lat)/2))
+
+        return self.geometry.area*KM_PER_DEGREE_LAT*km_per_degree_lon
+
+def _tile(coordinates:tuple, driving_time:float) -> tuple:
+    """
+    Snaps an isochrone request to its tile so nearby requests share one polygon
+
+    Params:
+    - coordinates (tuple): tuple of (long, lat)
+    - driving_time (float): driving time in hours
+
+    Returns:
+    - (tuple): (long, lat, range in seconds) rounded to TILE_DECIMALS and TILE_RANGE_SEC
+    """
+
+    range_sec = int(round(driving_time*60*60/TILE_RANGE_SEC)*TILE_RANGE_SEC)
+
+    return (round(coordinates[0], TILE_DECIMALS), round(coordinates[1], TILE_DECIMALS), range_sec)
+
+def get_isochrones(queries:List[tuple]) -> List[Isochrone]:
     """
-    Determines is one set of coordinates is within an isochrone
+    Gets many isochrones while spending as little of the daily isochrone quota as possible.
+    Requests are snapped to tiles and served from the tile cache when a nearby stop already has a polygon for the same range.
+    The remaining tiles are merged into multi-location, multi-range calls.
+
+    Params:
+    - queries (list of tuples): (coordinates, driving_time) pairs with coordinates as (long, lat) and driving_time in hours
+
+    Returns:
+    - (list of Isochrone): one per query, in the order of queries
+
+    Raise:
+    - if a response is missing the isochrone of a location and range it was asked for
+    """
+
+    from shapely.geometry import shape
+
+    tiles = [_tile(coordinates, driving_time) for coordinates, driving_time in queries]
+    isochrones = {}
+
+    for tile in dict.fromkeys(tiles):
+        geometry = cache.lookup(TILE_ENDPOINT, {"tile":tile})
+        if geometry is not None:
+            isochrones[tile] = Isochrone(shape(geometry))
+
+    # every range is applied to every location in a call, so group the missing locations by the ranges they need
+    ranges_by_location = {}
+    for tile in dict.fromkeys(tiles):
+        if tile not in isochrones:
+            ranges_by_location.setdefault(tile[:2], []).append(tile[2])
+    locations_by_ranges = {}
+    for location, ranges in ranges_by_location.items():
+        locations_by_ranges.setdefault(tuple(sorted(ranges)), []).append(location)
+
+    for ranges, locations in locations_by_ranges.items():
+        for i in range(0, len(locations), MAX_LOCATIONS_PER_REQUEST):
+            for j in range(0, len(ranges), MAX_RANGES_PER_REQUEST):
+                batch_locations = locations[i:i+MAX_LOCATIONS_PER_REQUEST]
+                batch_ranges = list(ranges[j:j+MAX_RANGES_PER_REQUEST])
+                response = request_isochrones(batch_locations, [range_sec/3600 for range_sec in batch_ranges])
+
+                for feature in response["features"]:
+                    location = batch_locations[feature["properties"]["group_index"]]
+                    tile = (location[0], location[1], int(round(feature["properties"]["value"])))
+                    cache.store(TILE_ENDPOINT, {"tile":tile}, feature["geometry"], "isochrone")
+                    isochrones[tile] = Isochrone(shape(feature["geometry"]))
+
+                missing = [(location, range_sec) for location in batch_locations for range_sec in batch_ranges if (location[0], location[1], range_sec) not in isochrones]
+                if len(missing) > 0:
+                    location, range_sec = missing[0]
+                    raise Exception(f"No isochrone returned for location {location} (long, lat) within {range_sec} seconds, {len(missing)} missing in total")
+
+    return [isochrones[tile] for tile in tiles]
+
+def get_isochrone(coordinates:tuple, driving_time:float) -> Isochrone:
+    """
+    Get the area that is accessible from one location within one driving time, see get_isochrones
 
     Params:
     coordinates (tuple): tuple of (long, lat)
+    driving_time (float): length of driving time in hours
+
+    Returns:
+    - (Isochrone)
+    """
+
+    return get_isochrones([(coordinates, driving_time)])[0]
+
+def calculate_isochrone_box(isochrone:dict) -> tuple:
+    """
+    Find the box that fits the isochrone: its furthest west, south, east and north extremes
+
+    Params:
     isochrone (dict): dict object returned from isochrone api call
 
     Returns:
-    boolean
+    - (tuple): (min long, min lat, max long, max lat)
+    """
+
+    return Isochrone.from_response(isochrone).bounds
+
+def is_in_isochrone(coordinates: tuple, isochrone) -> bool:
     """
+    Determines is one set of coordinates is within an isochrone. 
+    Pass an Isochrone when checking many coordinates so the geometry is only parsed once
 
-    isochrone_geometry = isochrone["features"][0]["geometry"]["coordinates"][0]
-    polygon = Polygon(isochrone_geometry)
+    Params:
+    coordinates (tuple): tuple of (long, lat)
+    isochrone (dict or Isochrone): dict object returned from isochrone api call, or the parsed Isochrone
+
+    Returns:
+    boolean
+    """
 
-    a = polygon.contains(Point(coordinates))
+    if not isinstance(isochrone, Isochrone):
+        isochrone = Isochrone.from_response(isochrone)
 
-    return a
+    return isochrone.contains(coordinates)
 
 if __name__=="__main__":
     coords = (8.681495, 49.41461)
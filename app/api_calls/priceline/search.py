@@ -1,7 +1,20 @@
-import requests
-import os
-from typing import List, Dict
+from api_calls import sessions
+from api_calls import quota
+from api_calls import listing_store
+from api_calls import cache
+from api_calls.cache import cached
+from api_calls.singleflight import single_flight
+from api_calls.stays import Stay
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from typing import List, Dict, Iterator
 
+# priceline location ids are cached per cell of coordinates rounded to 2 decimals, about 1 km
+LOCATION_CELL_DECIMALS = 2
+LOCATION_CELL_ENDPOINT = "priceline.location_cell"
+
+@cached("location")
+@single_flight
 def get_priceline_location_ids(lat:float, lon:float) -> dict:
     """
     Gets a priceline-specific location id to use as an argument in other endpoints
@@ -18,14 +31,14 @@ def get_priceline_location_ids(lat:float, lon:float) -> dict:
     HOST = "priceline-com2.p.rapidapi.com"
 
     headers={
-        "x-rapidapi-key":os.environ["PRICELINE_KEY"],
+        "x-rapidapi-key":quota.acquire("priceline"),
         "x-rapidapi-host": HOST
         }
     query={
         "latitude":str(lat),
         "longitude":str(lon)
         }
-    response = requests.get(ENDPOINT, headers=headers, params=query)
+    response = sessions.get(ENDPOINT, headers=headers, params=query)
     status_code = response.status_code
     response = response.json()
 
@@ -34,6 +47,8 @@ def get_priceline_location_ids(lat:float, lon:float) -> dict:
 
     return response
 
+@cached("rates")
+@single_flight
 def get_priceline_hotels(locationId:str, checkIn:str, checkOut:str, rooms:int=None, adults:int=None, children:int=None, limit:int=None, page:int=1, sort:str=None, hotelsType:str=None, minPrice:float=None, maxPrice:float=None, guestScore:float=None, starLevel:float=None, neighborhoods:str=None, amenities:str=None, propertyType:str=None, hotelName:str=None) -> List[Dict]:
     """
     Get details for hotels that match the search criteria.
@@ -59,7 +74,7 @@ def get_priceline_hotels(locationId:str, checkIn:str, checkOut:str, rooms:int=No
     - hotelName (str): not yet tested
 
     Returns: 
-    - (list of dictionaries): each dictionary contains details for one hotel
+    - (list of dictionaries): each hotel as returned by the api, with name, hotelId, pclnId, location, overallGuestRating, ratesSummary and proximity
     """
 
     ENDPOINT = "https://priceline-com2.p.rapidapi.com/hotels/search"
@@ -102,40 +117,96 @@ def get_priceline_hotels(locationId:str, checkIn:str, checkOut:str, rooms:int=No
         query["hotelName"]=hotelName
 
     headers = {
-        "x-rapidapi-key":os.environ["PRICELINE_KEY"]
+        "x-rapidapi-key":quota.acquire("priceline")
         , "x-rapidapi-host": HOST
     }
-    response = requests.get(ENDPOINT, headers=headers, params=query)
+    response = sessions.get(ENDPOINT, headers=headers, params=query)
     status_code = response.status_code
     response = response.json()
 
     if response["data"] == None:
         raise Exception(f"No data:: {status_code}\n{response}")
 
-    hotel_info = []
-    for hotel in response["data"]["hotels"]:
-        location_dict={
-            "hotelName":hotel["name"],
-            "hotelId":hotel["hotelId"],
-            "pclnId":hotel["pclnId"],
-            "address":hotel["location"]["address"]["addressLine1"],
-            "cityName":hotel["location"]["address"]["cityName"],
-            "provinceCode":hotel["location"]["address"]["provinceCode"],
-            "neighborhoodName":hotel["location"]["neighborhoodName"],
-            "latitude":hotel["location"]["latitude"],
-            "longitude":hotel["location"]["longitude"],
-            "overallGuestRating":hotel["overallGuestRating"],
-            #dealTypes is returned as a list if any entries exist, otherwise returns None
-            "dealTypes":"".join(str(z) for z in (['none' if hotel["dealTypes"]==None else (" ".join((str(x) for x in ['none' if d==None else d for d in hotel["dealTypes"]])))])),
-            "nightlyRateIncludingTaxesAndFees":hotel["ratesSummary"]["nightlyRateIncludingTaxesAndFees"],
-            "grandTotal":hotel["ratesSummary"]["grandTotal"],
-            "proximity":hotel["proximity"],
-            "checkIn":checkIn,
-            "checkOut":checkOut
-        }
-        hotel_info.append(location_dict)
+    # the hotels are kept as the api sent them, to_stay reads a Stay straight out of each one. No hotels past the last page
+    return response["data"].get("hotels") or []
+
+def to_stay(hotel:dict, checkIn:str, checkOut:str) -> Stay:
+    """
+    Reads a Stay straight from one hotel of a get_priceline_hotels response
+
+    Params:
+    - hotel (dict): one hotel as returned by the api
+    - checkIn (str): check in date the rate is for
+    - checkOut (str): check out date the rate is for
+
+    Returns:
+    - (Stay)
+    """
+
+    location = hotel["location"]
+
+    return Stay(
+        accomodationId=str(hotel["hotelId"]),
+        accomodationTitle=hotel["name"],
+        city=location["address"]["cityName"],
+        avgGuestRating=hotel["overallGuestRating"],
+        price=hotel["ratesSummary"]["nightlyRateIncludingTaxesAndFees"],
+        checkIn=checkIn,
+        checkOut=checkOut,
+        lat=location["latitude"],
+        long=location["longitude"],
+        stayType="hotel"
+    )
+
+def get_priceline_location_id(lat:float, lon:float) -> str:
+    """
+    Gets the priceline city id for a coordinate. Ids are cached per coordinate cell so nearby searches and later pages 
+    of the same search don't repeat the lookup
+
+    Params:
+    - lat (float): latitude
+    - lon (float): longitude
+
+    Returns:
+    - (str): priceline's city id
+    """
+
+    cell = (round(float(lat), LOCATION_CELL_DECIMALS), round(float(lon), LOCATION_CELL_DECIMALS))
+    location_id = cache.lookup(LOCATION_CELL_ENDPOINT, {"cell":cell})
+
+    if location_id is None:
+        location_ids = get_priceline_location_ids(lat, lon)
+        location_id = location_ids["data"]["exactMatch"]["matchedCity"]["cityID"]
+        cache.store(LOCATION_CELL_ENDPOINT, {"cell":cell}, location_id, "location")
+
+    return location_id
+
+def _save_hotels(hotels:List[Dict]) -> None:
+    """
+    Keeps the static details of hotels so later searches can find them locally, rates are always fetched live
+
+    Params:
+    - hotels (list of dictionaries): hotels from get_priceline_hotels
+    """
 
-    return hotel_info
+    listing_store.save_listings("priceline", [
+        {
+            "listing_id":hotel["hotelId"],
+            "lat":hotel["location"]["latitude"],
+            "long":hotel["location"]["longitude"],
+            "rating":hotel["overallGuestRating"],
+            "details":{
+                "hotelName":hotel["name"],
+                "hotelId":hotel["hotelId"],
+                "pclnId":hotel["pclnId"],
+                "address":hotel["location"]["address"]["addressLine1"],
+                "cityName":hotel["location"]["address"]["cityName"],
+                "provinceCode":hotel["location"]["address"]["provinceCode"],
+                "neighborhoodName":hotel["location"]["neighborhoodName"]
+            }
+        }
+        for hotel in hotels
+        ])
 
 def main(coordinates:tuple, checkIn:str, checkOut:str, limit:int, page:int=1) -> List[Dict]:
     """
@@ -149,13 +220,85 @@ def main(coordinates:tuple, checkIn:str, checkOut:str, limit:int, page:int=1) ->
     - page (int): index of page to return, 1-indexed. Defaults to first page. 
 
     Returns: 
-    - (list of dictionaries): each dict as a hotel with its details
+    - (list of dictionaries): each hotel as returned by the api, see get_priceline_hotels
     - empty list if there are no exactly matching cities for the given address
     """
 
-    location_ids = get_priceline_location_ids(coordinates[0], coordinates[1])
-
-    matched_location_id = location_ids["data"]["exactMatch"]["matchedCity"]["cityID"]
+    matched_location_id = get_priceline_location_id(coordinates[0], coordinates[1])
     hotels = get_priceline_hotels(locationId=matched_location_id, checkIn=checkIn, checkOut=checkOut, limit=limit, page=page)
+    _save_hotels(hotels)
+
+    return hotels
+
+def iter_priceline_hotels(coordinates:tuple, checkIn:str, checkOut:str, page_size:int=20, max_pages:int=5, first_page:int=1, stop:threading.Event=None) -> Iterator[Dict]:
+    """
+    Pages through every hotel matching a search, up to max_pages in total. Pages are requested in order and the next page
+    is only requested once the previous one came back full, while its hotels are being handed out, so no page past a short or empty one is ever requested.
+    Hotels repeated across pages are only yielded once.
+
+    Params:
+    - coordinates (tuple): search area as (lat, long)
+    - checkIn (str): check in time formatted "yyyy-mm-dd"
+    - checkOut (str): check out time formatted "yyyy-mm-dd"
+    - page_size (int): number of records per page
+    - max_pages (int): budget of pages to fetch
+    - first_page (int): index of the first page to fetch, 1-indexed
+    - stop (threading.Event): set by the consumer once it has enough stays, no further page is requested after it is set
+
+    Yields:
+    - (dict): each hotel as returned by the api, in page order
+
+    Raise:
+    - any error of a page request, a failed page is not mistaken for the last one
+    """
+
+    # look the location up once, every page reuses it
+    matched_location_id = get_priceline_location_id(coordinates[0], coordinates[1])
+    stop = threading.Event() if stop is None else stop
+    last_page = first_page + max_pages - 1
+    seen = set()
+
+    def fetch_page(page:int) -> List[Dict]:
+        return get_priceline_hotels(locationId=matched_location_id, checkIn=checkIn, checkOut=checkOut, limit=page_size, page=page)
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        page = first_page
+        next_page = executor.submit(fetch_page, page) if max_pages > 0 else None
+        while next_page is not None:
+            hotels = next_page.result()
+
+            # only a full page can have another after it
+            next_page = None
+            if len(hotels) >= page_size and page < last_page and not stop.is_set():
+                page += 1
+                next_page = executor.submit(fetch_page, page)
+
+            _save_hotels(hotels)
+            for hotel in hotels:
+                hotel_key = (hotel["hotelId"], hotel["pclnId"])
+                if hotel_key not in seen:
+                    seen.add(hotel_key)
+                    yield hotel
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def iter_priceline_stays(coordinates:tuple, checkIn:str, checkOut:str, limit:int, page:int=1, max_pages:int=1, stop:threading.Event=None) -> Iterator[Stay]:
+    """
+    Streams the hotels matching a search as stays, page by page as they arrive. See iter_priceline_hotels
+
+    Params:
+    - coordinates (tuple): search area as (lat, long)
+    - checkIn (str): check in time formatted "yyyy-mm-dd"
+    - checkOut (str): check out time formatted "yyyy-mm-dd"
+    - limit (int): number of records to limit per page.
+    - page (int): index of the first page to return, 1-indexed. Defaults to first page. 
+    - max_pages (int): budget of pages to fetch
+    - stop (threading.Event): see iter_priceline_hotels
+
+    Yields:
+    - (Stay): each hotel
+    """
 
-    return hotels
\ No newline at end of file
+    for hotel in iter_priceline_hotels(coordinates, checkIn, checkOut, page_size=limit, max_pages=max_pages, first_page=page, stop=stop):
+        yield to_stay(hotel, checkIn, checkOut)
@@ -0,0 +1,293 @@
+import sqlite3
+import os
+import time
+import threading
+from datetime import datetime, timezone
+from typing import List
+from api_calls.settings import get_settings
+
+# usage per key is kept on disk so budgets hold across runs. Set TRAVEL_APP_QUOTA to move it
+QUOTA_PATH = os.environ.get("TRAVEL_APP_QUOTA", os.path.join(os.path.expanduser("~"), ".cache", "travel_app", "quota.sqlite"))
+
+# request budget of each provider per key. keys are the environment variables holding the api keys, see settings.API_KEY_NAMES.
+# hour, day and month are caps counted on disk, per_minute is a rate limit the calls are paced at
+PROVIDER_QUOTAS = {
+    "priceline": {"keys":["PRICELINE_KEY"], "hour":1000, "month":500},
+    "airbnb": {"keys":["AIRBNB_KEY_1", "AIRBNB_KEY_2"], "month":16000},
+    "openroute_directions": {"keys":["OPENROUTE_KEY"], "day":2000, "per_minute":40},
+    "openroute_matrix": {"keys":["OPENROUTE_KEY"], "day":500, "per_minute":40},
+    "openroute_isochrone": {"keys":["OPENROUTE_KEY"], "day":500, "per_minute":20},
+    "geoapify": {"keys":["GEOAPIFY_KEY"], "day":3000}
+}
+
+# windows counted on disk, everything else in PROVIDER_QUOTAS is not a budget
+WINDOWS = ("hour", "day", "month")
+
+# low priority calls are shed once a key's remaining budget in any window drops below this share of the budget
+LOW_PRIORITY_RESERVE = 0.2
+
+class QuotaExceeded(Exception):
+    """
+    Raised when no key has budget left for a call
+    """
+    pass
+
+_lock = threading.RLock()
+_connection = None
+# calls are paced at the per_minute rates unless TRAVEL_APP_QUOTA_PACING_DISABLED=1, eg. when replaying recorded responses
+_pacing = os.environ.get("TRAVEL_APP_QUOTA_PACING_DISABLED") != "1"
+# token bucket per key: (tokens, last refill time)
+_buckets = {}
+
+def _get_connection() -> sqlite3.Connection:
+    """
+    Opens the usage database the first time it is needed and creates the usage table
+
+    Returns:
+    - (sqlite3.Connection): connection shared by all threads, guarded by the module lock
+    """
+
+    global _connection
+
+    if _connection is None:
+        directory = os.path.dirname(QUOTA_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        _connection = sqlite3.connect(QUOTA_PATH, check_same_thread=False)
+        _connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS usage (
+                provider TEXT NOT NULL,
+                key_name TEXT NOT NULL,
+                window TEXT NOT NULL,
+                window_start TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (provider, key_name, window, window_start)
+            )
+            """
+        )
+        _connection.commit()
+
+    return _connection
+
+def _window_start(window:str) -> str:
+    """
+    Start of the current calendar window in UTC
+
+    Params:
+    - window (str): hour, day or month
+
+    Returns:
+    - (str): window start formatted so it sorts and compares as text
+    """
+
+    now = datetime.now(timezone.utc)
+    formats = {"hour":"%Y-%m-%dT%H", "day":"%Y-%m-%d", "month":"%Y-%m"}
+
+    return now.strftime(formats[window])
+
+def _windows(provider:str) -> dict:
+    """
+    Budget of each window tracked for a provider
+
+    Params:
+    - provider (str): key of PROVIDER_QUOTAS
+
+    Returns:
+    - (dict): window name to its request budget
+    """
+
+    return {window:limit for window, limit in PROVIDER_QUOTAS[provider].items() if window in WINDOWS}
+
+def _used(provider:str, key_name:str, window:str) -> int:
+    """
+    Number of requests sent with a key in the current window
+
+    Params:
+    - provider (str): key of PROVIDER_QUOTAS
+    - key_name (str): environment variable holding the api key
+    - window (str): hour, day or month
+
+    Returns:
+    - (int)
+    """
+
+    row = _get_connection().execute(
+        "SELECT count FROM usage WHERE provider = ? AND key_name = ? AND window = ? AND window_start = ?",
+        (provider, key_name, window, _window_start(window))
+    ).fetchone()
+
+    return 0 if row is None else row[0]
+
+def _remaining_share(provider:str, key_name:str) -> float:
+    """
+    Smallest share of budget left in any of a key's windows
+
+    Params:
+    - provider (str): key of PROVIDER_QUOTAS
+    - key_name (str): environment variable holding the api key
+
+    Returns:
+    - (float): between 0 and 1
+    """
+
+    shares = [1 - _used(provider, key_name, window)/limit for window, limit in _windows(provider).items()]
+
+    return max(0.0, min(shares)) if len(shares) > 0 else 1.0
+
+def _take_token(provider:str, key_name:str) -> float:
+    """
+    Takes a token from the key's bucket, which holds one minute of calls and refills at the provider's per_minute rate.
+    Providers without a rate limit are never paced, their caps are enforced by the counters on disk
+
+    Params:
+    - provider (str): key of PROVIDER_QUOTAS
+    - key_name (str): environment variable holding the api key
+
+    Returns:
+    - (float): 0 if a token was taken, otherwise seconds until the next token
+    """
+
+    per_minute = PROVIDER_QUOTAS[provider].get("per_minute")
+    if per_minute is None or not _pacing:
+        return 0
+
+    rate = per_minute/60
+    capacity = max(1, per_minute)
+    now = time.monotonic()
+    tokens, last_refill = _buckets.get((provider, key_name), (capacity, now))
+    tokens = min(capacity, tokens + (now - last_refill)*rate)
+
+    if tokens >= 1:
+        _buckets[(provider, key_name)] = (tokens - 1, now)
+        return 0
+
+    _buckets[(provider, key_name)] = (tokens, now)
+
+    return (1 - tokens)/rate
+
+def _record(provider:str, key_name:str) -> None:
+    """
+    Counts one request against every window of a key
+
+    Params:
+    - provider (str): key of PROVIDER_QUOTAS
+    - key_name (str): environment variable holding the api key
+    """
+
+    connection = _get_connection()
+    for window in _windows(provider):
+        connection.execute(
+            """
+            INSERT INTO usage (provider, key_name, window, window_start, count) VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT (provider, key_name, window, window_start) DO UPDATE SET count = count + 1
+            """,
+            (provider, key_name, window, _window_start(window))
+        )
+    connection.commit()
+
+def acquire(provider:str, priority:str="normal", exclude:List[str]=None, block:bool=True) -> str:
+    """
+    Picks the api key with the most budget left for one call and counts the call against it.
+    Load is spread across keys before any of them runs out. Calls wait for the per_minute rate of providers that have one when the keys are busy.
+
+    Params:
+    - provider (str): key of PROVIDER_QUOTAS
+    - priority (str): "low" calls are shed once every key is into its LOW_PRIORITY_RESERVE, "normal" calls use the whole budget
+    - exclude (list): environment variables of keys not to use, eg. a key that just failed
+    - block (bool): wait for the per_minute rate instead of raising
+
+    Returns:
+    - (str): the api key
+
+    Raise:
+    - QuotaExceeded if no key has budget left, or would have to wait and block is False
+    - KeyError if none of the provider's keys were set in the environment when the settings were loaded
+    """
+
+    exclude = [] if exclude is None else exclude
+    api_keys = get_settings().api_keys
+    key_names = [key_name for key_name in PROVIDER_QUOTAS[provider]["keys"] if key_name not in exclude]
+    available_key_names = [key_name for key_name in key_names if key_name in api_keys]
+    if len(available_key_names) == 0:
+        raise KeyError(f"No api key set for {provider}, expected one of {key_names}")
+
+    reserve = LOW_PRIORITY_RESERVE if priority == "low" else 0
+
+    while True:
+        with _lock:
+            shares = {key_name:_remaining_share(provider, key_name) for key_name in available_key_names}
+            usable = [key_name for key_name, share in shares.items() if share > reserve]
+            if len(usable) == 0:
+                raise QuotaExceeded(f"No {provider} budget left for {priority} priority calls: {remaining(provider)}")
+
+            # the key with the most budget left takes the call
+            usable.sort(key=lambda key_name: shares[key_name], reverse=True)
+            waits = []
+            for key_name in usable:
+                wait_sec = _take_token(provider, key_name)
+                if wait_sec == 0:
+                    _record(provider, key_name)
+                    return api_keys[key_name]
+                waits.append(wait_sec)
+
+        if not block:
+            raise QuotaExceeded(f"{provider} is at its per_minute rate, next request in {min(waits):.1f} seconds")
+        time.sleep(min(waits))
+
+def key_name_for(provider:str, key:str) -> str:
+    """
+    Finds which environment variable an api key came from
+
+    Params:
+    - provider (str): key of PROVIDER_QUOTAS
+    - key (str): api key returned by acquire
+
+    Returns:
+    - (str): environment variable name, None if the key is not one of the provider's
+    """
+
+    api_keys = get_settings().api_keys
+    for key_name in PROVIDER_QUOTAS[provider]["keys"]:
+        if api_keys.get(key_name) == key:
+            return key_name
+
+    return None
+
+def set_pacing(enabled:bool) -> bool:
+    """
+    Turns pacing at the per_minute rates on or off for this process, the caps are still counted
+
+    Params:
+    - enabled (bool): False never makes a call wait for its rate
+
+    Returns:
+    - (bool): whether pacing was on before, to restore it
+    """
+
+    global _pacing
+
+    with _lock:
+        previous = _pacing
+        _pacing = enabled
+
+    return previous
+
+def remaining(provider:str) -> dict:
+    """
+    Budget left for a provider in each window, summed over its keys that are set, see settings.Settings.api_keys
+
+    Params:
+    - provider (str): key of PROVIDER_QUOTAS
+
+    Returns:
+    - (dict): window name to requests left, eg. {"hour": 998, "month": 431}
+    """
+
+    api_keys = get_settings().api_keys
+    with _lock:
+        budget = {}
+        for window, limit in _windows(provider).items():
+            budget[window] = sum(max(0, limit - _used(provider, key_name, window)) for key_name in PROVIDER_QUOTAS[provider]["keys"] if key_name in api_keys)
+
+    return budget
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+from api_calls import sessions
+from api_calls.cache import make_key
+
+# query params holding api keys, never written to fixtures or used in fixture keys
+SECRET_PARAMS = ("apiKey",)
+
+def fixture_key(method:str, host:str, path:str, query:str, body) -> str:
+    """
+    Identifies a request independently of the api key it was sent with, so a recorded response can be found again
+
+    Params:
+    - method (str): http method
+    - host (str): host of the real api, eg. api.openrouteservice.org
+    - path (str): url path
+    - query (str): url query string
+    - body (bytes or str): request body, None for GET requests
+
+    Returns:
+    - (str): fixture key
+    """
+
+    params = {name:value for name, value in parse_qsl(query, keep_blank_values=True) if name not in SECRET_PARAMS}
+
+    if isinstance(body, bytes):
+        body = body.decode("utf-8")
+    if body:
+        try:
+            body = json.loads(body)
+        except ValueError:
+            pass
+
+    return make_key(f"{method.upper()} {host}{path}", {"query":params, "body":body or None})
+
+class Recorder:
+    """
+    Saves every response received through the shared sessions as a fixture file that StubServer can serve later
+    """
+
+    def __init__(self, directory:str):
+        """
+        Params:
+        - directory (str): folder to write fixtures to, created if missing
+        """
+
+        self.directory = directory
+        self.recorded = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, method:str, url:str, response) -> None:
+        """
+        Session hook writing one response to {directory}/{fixture key}.json
+        """
+
+        parts = urlsplit(response.request.url)
+        key = fixture_key(method, parts.netloc, parts.path, parts.query, response.request.body)
+        query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if name not in SECRET_PARAMS]
+        fixture = {
+            "method":method.upper(),
+            "host":parts.netloc,
+            "path":parts.path,
+            "query":query,
+            "status":response.status_code,
+            "content_type":response.headers.get("Content-Type", "application/json"),
+            "body":response.text
+        }
+
+        with self._lock:
+            with open(os.path.join(self.directory, f"{key}.json"), "w") as f:
+                json.dump(fixture, f)
+            self.recorded += 1
+
+def load_fixtures(directory:str) -> dict:
+    """
+    Reads every fixture recorded in a folder
+
+    Params:
+    - directory (str): folder written by a Recorder
+
+    Returns:
+    - (dict): fixture key to fixture
+    """
+
+    fixtures = {}
+    for file_name in os.listdir(directory):
+        if file_name.endswith(".json"):
+            with open(os.path.join(directory, file_name), "r") as f:
+                fixtures[file_name[:-len(".json")]] = json.load(f)
+
+    return fixtures
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    """
+    Answers requests for /{real host}/{real path} with the recorded response, 404 if nothing was recorded
+    """
+
+    def _replay(self) -> None:
+        parts = urlsplit(self.path)
+        host, _, path = parts.path.lstrip("/").partition("/")
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length > 0 else None
+        key = fixture_key(self.command, host, "/" + path, parts.query, body)
+
+        fixture = self.server.fixtures.get(key)
+        self.server.count(fixture is not None)
+        delay_sec = self.server.latency_sec + random.uniform(0, self.server.jitter_sec)
+        if delay_sec > 0:
+            time.sleep(delay_sec)
+
+        if fixture is None:
+            status, content_type, payload = 404, "application/json", json.dumps({"error":f"no fixture for {self.command} {host}/{path}"})
+        else:
+            status, content_type, payload = fixture["status"], fixture["content_type"], fixture["body"]
+
+        payload = payload.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = _replay
+    do_POST = _replay
+
+    def log_message(self, format, *args) -> None:
+        # one line per request would drown out the benchmark output
+        pass
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Local http server standing in for every provider with recorded responses and injected latency
+    """
+
+    daemon_threads = True
+
+    def __init__(self, fixtures:dict, latency_sec:float=0, jitter_sec:float=0):
+        """
+        Params:
+        - fixtures (dict): see load_fixtures
+        - latency_sec (float): delay added to every response
+        - jitter_sec (float): extra random delay of up to this many seconds added to every response
+        """
+
+        super().__init__(("127.0.0.1", 0), _ReplayHandler)
+        self.fixtures = fixtures
+        self.latency_sec = latency_sec
+        self.jitter_sec = jitter_sec
+        self.hits = 0
+        self.misses = 0
+        self._count_lock = threading.Lock()
+
+    def count(self, hit:bool) -> None:
+        """
+        Counts one replayed request as a hit or a miss
+        """
+
+        with self._count_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def base_url(self) -> str:
+        """
+        (str): url to pass to sessions.redirect
+        """
+
+        host, port = self.server_address[:2]
+
+        return f"http://{host}:{port}"
+
+@contextmanager
+def record(directory:str):
+    """
+    Records every response received inside the with block into a fixture folder
+
+    Params:
+    - directory (str): folder to write fixtures to
+
+    Returns:
+    - (Recorder): counts the fixtures written
+    """
+
+    recorder = Recorder(directory)
+    sessions.add_hook(recorder)
+    try:
+        yield recorder
+    finally:
+        sessions.remove_hook(recorder)
+
+@contextmanager
+def replay(directory:str, latency_sec:float=0, jitter_sec:float=0):
+    """
+    Serves recorded responses from a local stub server for every request sent inside the with block, no api is called
+
+    Params:
+    - directory (str): folder written by record
+    - latency_sec (float): delay added to every response
+    - jitter_sec (float): extra random delay of up to this many seconds added to every response
+
+    Returns:
+    - (StubServer): counts the requests that did or did not have a fixture
+    """
+
+    server = StubServer(load_fixtures(directory), latency_sec, jitter_sec)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    sessions.redirect(server.base_url)
+    try:
+        yield server
+    finally:
+        sessions.redirect(None)
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,169 @@
+import requests
+import threading
+from typing import Callable
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# seconds to wait to open a connection and then for each read. Without these a hung socket blocks forever
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# retry server errors with exponential backoff: 0.5s, 1s, 2s...
+# 429 is not retried: every api here is metered by quota.acquire, so a retry would be a call its budget never counted.
+# the 429 is handed back to the caller instead
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+# longest wait a Retry-After header can ask for before a retry, a server asking for more is waited on for this long
+MAX_RETRY_AFTER_SEC = 30
+
+# connections kept alive per host, should be at least the number of threads calling the same api
+POOL_MAXSIZE = 16
+
+_lock = threading.Lock()
+_sessions = {}
+# functions called with (method, url, response) after every request, eg. to record responses or time calls
+_hooks = []
+# when set, every request is sent to this base url instead of its own host, see redirect
+_redirect_base_url = None
+
+class _CappedRetry(Retry):
+    """
+    Retry that honours Retry-After headers up to MAX_RETRY_AFTER_SEC, so one response cannot stall a worker for minutes
+    """
+
+    # urllib3 retries these whenever they carry a Retry-After header, whatever the status_forcelist says. Keeps 429 out
+    RETRY_AFTER_STATUS_CODES = frozenset([503])
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+
+        return None if retry_after is None else min(retry_after, MAX_RETRY_AFTER_SEC)
+
+def _new_session() -> requests.Session:
+    """
+    Creates a session with a keep-alive connection pool and retries on 5xx
+
+    Returns:
+    - (requests.Session)
+    """
+
+    retry = _CappedRetry(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        # openrouteservice uses POST for read-only queries so it is safe to retry
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+        # hand the last response back to the caller instead of raising so the existing status code checks still apply
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+def get_session(url:str) -> requests.Session:
+    """
+    Gets the shared session for the host of a url, creating it on first use
+
+    Params:
+    - url (str): any url on the host
+
+    Returns:
+    - (requests.Session): session whose connections are reused by every module calling this host
+    """
+
+    host = urlsplit(url).netloc
+
+    with _lock:
+        if host not in _sessions:
+            _sessions[host] = _new_session()
+
+        return _sessions[host]
+
+def request(method:str, url:str, **kwargs) -> requests.Response:
+    """
+    Sends a request through the shared session for the url's host. Takes the same keyword arguments as requests.request
+
+    Params:
+    - method (str): http method
+    - url (str): url to request
+
+    Returns:
+    - (requests.Response)
+    """
+
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+
+    if _redirect_base_url is not None:
+        parts = urlsplit(url)
+        url = f"{_redirect_base_url}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+    response = get_session(url).request(method, url, **kwargs)
+
+    for hook in list(_hooks):
+        hook(method, url, response)
+
+    return response
+
+def get(url:str, **kwargs) -> requests.Response:
+    """
+    Sends a GET request through the shared session. See request
+    """
+
+    return request("GET", url, **kwargs)
+
+def post(url:str, **kwargs) -> requests.Response:
+    """
+    Sends a POST request through the shared session. See request
+    """
+
+    return request("POST", url, **kwargs)
+
+def add_hook(hook:Callable[[str, str, requests.Response], None]) -> None:
+    """
+    Registers a function to call after every request sent through the shared sessions
+
+    Params:
+    - hook (function): takes the method, the url requested and the response
+    """
+
+    with _lock:
+        _hooks.append(hook)
+
+def remove_hook(hook:Callable[[str, str, requests.Response], None]) -> None:
+    """
+    Stops calling a function registered with add_hook
+    """
+
+    with _lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+def redirect(base_url:str) -> None:
+    """
+    Sends every request to a stand-in server instead of the real apis, eg. https://api.x.com/v1/a?b=1 goes to {base_url}/api.x.com/v1/a?b=1
+
+    Params:
+    - base_url (str): scheme and host of the stand-in server, eg. http://127.0.0.1:8000. None sends requests to the real apis again
+    """
+
+    global _redirect_base_url
+
+    _redirect_base_url = None if base_url is None else base_url.rstrip("/")
+
+def close_all() -> None:
+    """
+    Closes every shared session and its pooled connections
+    """
+
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,137 @@
+import os
+import re
+import sys
+import json
+import threading
+import subprocess
+from dataclasses import dataclass
+from types import MappingProxyType
+
+# config files are found from this file instead of the working directory so the app can be run from anywhere
+API_CALLS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(API_CALLS_DIR)
+
+# seconds a fresh interpreter may spend importing an entry module, see measure_import_time
+IMPORT_TIME_BUDGET_SEC = 0.5
+
+# environment variables holding the api keys, every key named in quota.PROVIDER_QUOTAS
+API_KEY_NAMES = ("PRICELINE_KEY", "AIRBNB_KEY_1", "AIRBNB_KEY_2", "OPENROUTE_KEY", "GEOAPIFY_KEY")
+
+# fields every config file must have
+REQUIRED_AIRBNB_PARAMS = ("x-rapidapi-host", "endpoint_lat_long", "endpoint_details", "endpoint_availability")
+REQUIRED_OPENROUTE_HEADERS = ("Accept", "Content-Type")
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Provider config loaded and checked once per process. Frozen so no caller can change it for the others
+
+    Attributes:
+    - airbnb_host (str): x-rapidapi-host header for the airbnb api
+    - airbnb_endpoint_lat_long (str): url of the listings search
+    - airbnb_endpoint_details (str): url of the listing details
+    - airbnb_endpoint_availability (str): url of the listing calendar
+    - openroute_headers (MappingProxyType): read-only headers sent with every openrouteservice request, copy them before adding the key
+    - api_keys (MappingProxyType): read-only api keys by the environment variable they were read from, only the ones that were set
+    - missing_keys (tuple): environment variables of api keys that were not set when the settings were loaded
+    """
+
+    airbnb_host: str
+    airbnb_endpoint_lat_long: str
+    airbnb_endpoint_details: str
+    airbnb_endpoint_availability: str
+    openroute_headers: MappingProxyType
+    api_keys: MappingProxyType
+    missing_keys: tuple
+
+_lock = threading.Lock()
+_settings = None
+
+def _load_json(relative_path:str, required:tuple) -> dict:
+    """
+    Reads a config file under api_calls and checks it has every required field
+
+    Params:
+    - relative_path (str): path from the api_calls folder, eg. airbnb/api_params.json
+    - required (tuple): fields that must be in the file
+
+    Returns:
+    - (dict)
+
+    Raise:
+    - if the file is missing a required field
+    """
+
+    path = os.path.join(API_CALLS_DIR, relative_path)
+    with open(path, "r") as f:
+        config = json.load(f)
+
+    missing = [field for field in required if field not in config]
+    if len(missing) > 0:
+        raise Exception(f"{path} is missing {missing}")
+
+    return config
+
+def load_settings() -> Settings:
+    """
+    Reads and checks every config file and reads the api keys from the environment. Use get_settings to share one copy
+
+    Returns:
+    - (Settings)
+    """
+
+    airbnb_params = _load_json(os.path.join("airbnb", "api_params.json"), REQUIRED_AIRBNB_PARAMS)
+    openroute_headers = _load_json(os.path.join("openroute_service", "api_params.json"), REQUIRED_OPENROUTE_HEADERS)
+    api_keys = {key_name:os.environ[key_name] for key_name in API_KEY_NAMES if key_name in os.environ}
+
+    return Settings(
+        airbnb_host=airbnb_params["x-rapidapi-host"],
+        airbnb_endpoint_lat_long=airbnb_params["endpoint_lat_long"],
+        airbnb_endpoint_details=airbnb_params["endpoint_details"],
+        airbnb_endpoint_availability=airbnb_params["endpoint_availability"],
+        openroute_headers=MappingProxyType(openroute_headers),
+        api_keys=MappingProxyType(api_keys),
+        missing_keys=tuple(key_name for key_name in API_KEY_NAMES if key_name not in api_keys)
+    )
+
+def get_settings() -> Settings:
+    """
+    Gets the settings, loading them the first time they are needed
+
+    Returns:
+    - (Settings): the same object for every caller
+    """
+
+    global _settings
+
+    with _lock:
+        if _settings is None:
+            _settings = load_settings()
+            if len(_settings.missing_keys) > 0:
+                print(f"Api keys not set, calls that need them will fail: {list(_settings.missing_keys)}")
+
+        return _settings
+
+def measure_import_time(module:str) -> float:
+    """
+    Times importing a module in a fresh interpreter, the cost a short-lived command or worker pays before doing anything
+
+    Params:
+    - module (str): module to import from the app folder, eg. getRoadTripRoute
+
+    Returns:
+    - (float): seconds spent importing the module and everything it imports, compare with IMPORT_TIME_BUDGET_SEC
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR, capture_output=True, text=True, check=True
+    )
+
+    # python -X importtime prints "import time: self | cumulative | name" per module to stderr, in microseconds
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s?(.*)$", line)
+        if match and match.group(2) == module:
+            return int(match.group(1))/1e6
+
+    raise Exception(f"No import time reported for {module}")
@@ -0,0 +1,58 @@
+import inspect
+import threading
+import functools
+from concurrent.futures import Future
+from typing import Callable
+from api_calls.cache import make_key
+
+_lock = threading.Lock()
+# call key to the future of the request currently being sent for it
+_in_flight = {}
+
+def single_flight(func:Callable) -> Callable:
+    """
+    Decorator that coalesces identical concurrent calls to an api client function.
+    The first caller sends the request, callers with the same arguments that arrive while it is in flight wait for it
+    and get the same result (or exception), so N concurrent callers cost one upstream request.
+    Callers share the returned object so they should not mutate it.
+
+    Params:
+    - func (function): api client function
+
+    Returns:
+    - (function)
+    """
+
+    endpoint = f"{func.__module__}.{func.__qualname__}"
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = make_key(endpoint, dict(bound.arguments))
+
+        with _lock:
+            future = _in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                _in_flight[key] = future
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with _lock:
+                del _in_flight[key]
+
+        return result
+
+    return wrapper
@@ -0,0 +1,70 @@
+from dataclasses import dataclass, fields
+from typing import List
+
+@dataclass(slots=True)
+class Stay:
+    """
+    One accommodation option from any provider, with the fields shared by every provider
+
+    Attributes:
+    - accomodationId (str): provider's id for the hotel or listing
+    - accomodationTitle (str): hotel name or listing title
+    - city (str): city name
+    - avgGuestRating (float): rating on the provider's own scale, see rankStays.RATING_SCALES
+    - price (float): nightly rate including taxes and fees, None if the provider does not return one
+    - checkIn (str): check in date YYYY-MM-DD
+    - checkOut (str): check out date YYYY-MM-DD
+    - lat (float): latitude
+    - long (float): longitude
+    - stayType (str): hotel or airbnb
+    """
+
+    accomodationId: str
+    accomodationTitle: str
+    city: str
+    avgGuestRating: float
+    price: float
+    checkIn: str
+    checkOut: str
+    lat: float
+    long: float
+    stayType: str
+
+# fixed dtype of each Stay column once a batch of stays becomes a DataFrame
+STAY_DTYPES = {
+    "accomodationId": "string",
+    "accomodationTitle": "string",
+    "city": "category",
+    "avgGuestRating": "float32",
+    "price": "float32",
+    "checkIn": "string",
+    "checkOut": "string",
+    "lat": "float64",
+    "long": "float64",
+    "stayType": "category"
+}
+
+STAY_COLUMNS = [field.name for field in fields(Stay)]
+
+def stays_to_frame(stays:List[Stay]):
+    """
+    Builds a DataFrame from stays one column at a time, straight into the STAY_DTYPES
+
+    Params:
+    - stays (list of Stay)
+
+    Returns:
+    - (pd.DataFrame): one row per stay with the STAY_COLUMNS columns
+    """
+
+    import pandas as pd
+
+    columns = {}
+    for column in STAY_COLUMNS:
+        values = [getattr(stay, column) for stay in stays]
+        if STAY_DTYPES[column].startswith("float"):
+            # providers send None for missing ratings and prices
+            values = [float("nan") if value is None else value for value in values]
+        columns[column] = pd.Series(values, dtype=STAY_DTYPES[column])
+
+    return pd.DataFrame(columns)
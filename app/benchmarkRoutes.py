@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import numpy as np
+from typing import List
+
+# every store starts empty and the response cache is off, so a run sends the same requests as the recording did.
+# the stores read these when they are imported so they are set before any app module is
+_workdir = tempfile.mkdtemp(prefix="travel_app_benchmark_")
+os.environ["TRAVEL_APP_CACHE"] = os.path.join(_workdir, "responses.sqlite")
+os.environ["TRAVEL_APP_CACHE_DISABLED"] = "1"
+os.environ["TRAVEL_APP_LISTINGS"] = os.path.join(_workdir, "listings.sqlite")
+os.environ["TRAVEL_APP_CALENDARS"] = os.path.join(_workdir, "calendars.sqlite")
+os.environ["TRAVEL_APP_QUOTA"] = os.path.join(_workdir, "quota.sqlite")
+
+from api_calls import sessions
+from api_calls import replay
+from api_calls import quota
+from api_calls.settings import API_KEY_NAMES
+from getRoadTripRoute import get_route
+
+# routes of increasing length, all starting on the same date so the recorded stay searches match on replay
+BENCHMARK_TRIPS = [
+    {"name":"short", "start_address":"1709 F Street Bellingham Washington", "finish_address":"820 15 Ave SW Calgary Alberta", "daily_driving_limit":7},
+    {"name":"medium", "start_address":"Seattle Washington", "finish_address":"Denver Colorado", "daily_driving_limit":7},
+    {"name":"long", "start_address":"Vancouver British Columbia", "finish_address":"Chicago Illinois", "daily_driving_limit":7},
+    {"name":"cross country", "start_address":"Seattle Washington", "finish_address":"Miami Florida", "daily_driving_limit":7}
+]
+
+# planners measured on every trip
+PLANNERS = {
+    "split_route":lambda trip: get_route(trip["start_address"], trip["finish_address"], trip["daily_driving_limit"], trip["trip_start_date"], split_route=True),
+    "reroute_each_night":lambda trip: get_route(trip["start_address"], trip["finish_address"], trip["daily_driving_limit"], trip["trip_start_date"], split_route=False)
+}
+
+class CallLog:
+    """
+    Session hook keeping the host and latency of every request sent while a planner runs
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, method:str, url:str, response) -> None:
+        # replayed requests go to /{real host}/... on the stub server
+        host = url.split("/")[3] if url.startswith("http://127.0.0.1") else url.split("/")[2]
+        with self._lock:
+            self.calls.append((host, response.elapsed.total_seconds()))
+
+def run_trip(trip:dict, planner:str, measure_memory:bool=True) -> dict:
+    """
+    Plans one trip and measures it. The timed pass runs without tracemalloc, which slows every allocation down,
+    and peak memory is measured in a second pass. The second pass finds the listings and calendars the first one stored,
+    so only the first pass's calls are counted
+
+    Params:
+    - trip (dict): one of the BENCHMARK_TRIPS with trip_start_date added
+    - planner (str): key of PLANNERS
+    - measure_memory (bool): run the memory pass. False leaves peak_mb as None, eg. when recording against the live apis
+
+    Returns:
+    - (dict): calls in total and per host, wall_sec, p50_ms and p95_ms latency per call, peak_mb of memory allocated,
+    number of stops in the route and the error if the planner failed
+    """
+
+    log = CallLog()
+    sessions.add_hook(log)
+    start = time.perf_counter()
+    error = None
+    route = []
+
+    try:
+        route = PLANNERS[planner](trip)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        wall_sec = time.perf_counter() - start
+        sessions.remove_hook(log)
+
+    peak_bytes = None
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            PLANNERS[planner](trip)
+        except Exception:
+            # already reported by the timed pass
+            pass
+        finally:
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    latencies_ms = np.array([latency for _, latency in log.calls], dtype=np.float64)*1000
+    calls_per_host = {}
+    for host, _ in log.calls:
+        calls_per_host[host] = calls_per_host.get(host, 0) + 1
+
+    return {
+        "trip":trip["name"],
+        "planner":planner,
+        "stops":len(route),
+        "calls":len(log.calls),
+        "calls_per_host":calls_per_host,
+        "wall_sec":round(wall_sec, 3),
+        "p50_ms":round(float(np.percentile(latencies_ms, 50)), 1) if len(latencies_ms) > 0 else None,
+        "p95_ms":round(float(np.percentile(latencies_ms, 95)), 1) if len(latencies_ms) > 0 else None,
+        "peak_mb":round(peak_bytes/2**20, 2) if peak_bytes is not None else None,
+        "error":error
+    }
+
+def run_all(trips:List[dict], planners:List[str], measure_memory:bool=True) -> List[dict]:
+    """
+    Measures every planner on every trip, printing each result as it finishes
+
+    Params:
+    - trips (list of dictionaries): see BENCHMARK_TRIPS
+    - planners (list): keys of PLANNERS
+    - measure_memory (bool): see run_trip
+
+    Returns:
+    - (list of dictionaries): see run_trip
+    """
+
+    print(f"{'trip':<15}{'planner':<20}{'stops':>6}{'calls':>7}{'wall s':>9}{'p50 ms':>9}{'p95 ms':>9}{'peak MB':>9}")
+    results = []
+    for trip in trips:
+        for planner in planners:
+            result = run_trip(trip, planner, measure_memory)
+            results.append(result)
+            print(
+                f"{result['trip']:<15}{result['planner']:<20}{result['stops']:>6}{result['calls']:>7}{result['wall_sec']:>9.2f}"
+                f"{result['p50_ms'] or 0:>9.1f}{result['p95_ms'] or 0:>9.1f}{result['peak_mb'] or 0:>9.2f}"
+            )
+            if result["error"] is not None:
+                print(f"    failed: {result['error']}")
+
+    return results
+
+def record_fixtures(fixtures_dir:str, trip_start_date:str, planners:List[str]) -> None:
+    """
+    Plans every benchmark trip against the live apis and saves each response. Needs the real api keys and uses their budget
+
+    Params:
+    - fixtures_dir (str): folder to save responses and the trips to
+    - trip_start_date (str): YYYY-MM-DD, should be in the future so stays are still bookable
+    - planners (list): keys of PLANNERS
+    """
+
+    trips = [dict(trip, trip_start_date=trip_start_date) for trip in BENCHMARK_TRIPS]
+
+    # a memory pass would spend the live budget a second time
+    with replay.record(os.path.join(fixtures_dir, "responses")) as recorder:
+        run_all(trips, planners, measure_memory=False)
+
+    with open(os.path.join(fixtures_dir, "trips.json"), "w") as f:
+        json.dump({"trips":trips, "planners":planners}, f, indent=2)
+
+    print(f"Recorded {recorder.recorded} responses to {fixtures_dir}")
+
+def replay_fixtures(fixtures_dir:str, latency_sec:float, jitter_sec:float) -> List[dict]:
+    """
+    Plans the recorded trips against a local stub server serving the recorded responses, without keys or network
+
+    Params:
+    - fixtures_dir (str): folder written by record_fixtures
+    - latency_sec (float): delay added to every response
+    - jitter_sec (float): extra random delay of up to this many seconds added to every response
+
+    Returns:
+    - (list of dictionaries): see run_trip
+    """
+
+    with open(os.path.join(fixtures_dir, "trips.json"), "r") as f:
+        recording = json.load(f)
+
+    # any value works as a key since nothing leaves the machine. Set before the settings are first loaded, which reads them
+    for key_name in API_KEY_NAMES:
+        os.environ.setdefault(key_name, "replay")
+
+    # the stub server has no rate limit, waiting for one would be timed instead of the planners
+    pacing = quota.set_pacing(False)
+    try:
+        with replay.replay(os.path.join(fixtures_dir, "responses"), latency_sec, jitter_sec) as server:
+            results = run_all(recording["trips"], recording["planners"])
+    finally:
+        quota.set_pacing(pacing)
+
+    if server.misses > 0:
+        print(f"{server.misses} requests had no recorded response, record the fixtures again if the planners changed")
+
+    return results
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Measure route planning offline from recorded api responses")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="plan the benchmark trips against the live apis and save the responses")
+    record_parser.add_argument("--fixtures", required=True, help="folder to save the responses to")
+    record_parser.add_argument("--start-date", required=True, help="trip start date YYYY-MM-DD")
+    record_parser.add_argument("--planners", nargs="+", default=list(PLANNERS), choices=list(PLANNERS))
+
+    run_parser = subparsers.add_parser("run", help="plan the recorded trips against a local stub server")
+    run_parser.add_argument("--fixtures", required=True, help="folder written by record")
+    run_parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    run_parser.add_argument("--jitter", type=float, default=0.02, help="up to this many random seconds added to every response")
+    run_parser.add_argument("--output", help="save the results as json, eg. to compare two commits")
+
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record_fixtures(args.fixtures, args.start_date, args.planners)
+    else:
+        results = replay_fixtures(args.fixtures, args.latency, args.jitter)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+
+    sessions.close_all()
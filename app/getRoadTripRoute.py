@@ -1,11 +1,200 @@
-from api_calls.openroute_service.directions import get_driving_directions, get_end_of_day_step, get_coordinates_from_waypoints
-from api_calls.geocoder.search import get_geocoded_address
+from api_calls.openroute_service.directions import get_driving_directions, get_end_of_day_step, get_coordinates_from_waypoints, get_overnight_cut_points
+from api_calls.geocoder.search import get_batch_geocoded_addresses
 from searchStays import search_all_stays, get_best_stay
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 import math
 
-def get_route(start_address:str, finish_address:str, daily_driving_limit:float, trip_start_date:str) -> List[tuple]:
+# priceline hotels per page, and search pages fetched from each provider for each overnight stop.
+# up to 40 hotels for at most 2 of the monthly priceline calls, and up to 100 airbnbs
+HOTEL_PAGE_SIZE = 20
+SEARCH_MAX_PAGES = 2
+
+def choose_stay(coordinates:tuple, checkIn:str, checkOut:str, page_size:int=HOTEL_PAGE_SIZE, max_pages:int=SEARCH_MAX_PAGES) -> dict:
+    """
+    Searches stays around one point and picks the best one, without measuring the detour to it
+
+    Params:
+    - coordinates (tuple): lat long to search around
+    - checkIn (str): YYYY-MM-DD
+    - checkOut (str): YYYY-MM-DD
+    - page_size (int): priceline hotels per page
+    - max_pages (int): budget of search pages from each provider, a provider's search stops early at a short page
+
+    Returns:
+    - (dict): the chosen stay and its coordinates, both None if no stay was found
+    """
+
+    accomodation_options = search_all_stays(coordinates, checkIn, checkOut, range=2000, limit=page_size, max_pages=max_pages)
+    if len(accomodation_options) == 0:
+        print(f"No stays found near {coordinates} on {checkIn}")
+        return {"stay":None, "stay_coordinates":None}
+
+    best_accomodation = get_best_stay(accomodation_options, coordinates)
+
+    return {
+        "stay":best_accomodation,
+        "stay_coordinates":(best_accomodation["lat"], best_accomodation["long"])
+    }
+
+def get_detour_sec(coordinates:tuple, stay_coordinates:tuple) -> float:
+    """
+    Driving time from a point on the route out to a stay
+
+    Params:
+    - coordinates (tuple): lat long on the route
+    - stay_coordinates (tuple): lat long of the stay, None if the night has no stay
+
+    Returns:
+    - (float): seconds, 0 if there is no stay
+    """
+
+    if stay_coordinates is None:
+        return 0
+
+    detour = get_driving_directions(coordinates, stay_coordinates)
+
+    return detour["features"][0]["properties"]["summary"]["duration"]
+
+def plan_stop(coordinates:tuple, checkIn:str, checkOut:str) -> dict:
+    """
+    Searches stays around one overnight stop, picks the best one and measures the detour to it
+
+    Params:
+    - coordinates (tuple): lat long of the stop on the route
+    - checkIn (str): YYYY-MM-DD
+    - checkOut (str): YYYY-MM-DD
+
+    Returns:
+    - (dict): the chosen stay, its coordinates and detour_duration_sec from the stop to the stay.
+    stay and stay_coordinates are None, with no detour, if no stay was found so the rest of the trip can still be planned
+    """
+
+    stop = choose_stay(coordinates, checkIn, checkOut)
+
+    return {**stop, "detour_duration_sec":get_detour_sec(coordinates, stop["stay_coordinates"])}
+
+def plan_night(cut_point:dict, checkIn:str, checkOut:str) -> dict:
+    """
+    Searches stays around one overnight cut point and picks the best one
+
+    Params:
+    - cut_point (dict): one of the cut points from get_overnight_cut_points
+    - checkIn (str): YYYY-MM-DD
+    - checkOut (str): YYYY-MM-DD
+
+    Returns:
+    - (dict): the cut point coordinates, the chosen stay, check in date and detour_duration_sec from the cut point to the stay
+    """
+
+    cut_coordinates = cut_point["coordinates"]
+    stop = plan_stop(cut_coordinates, checkIn, checkOut)
+
+    return {
+        "cut_coordinates":cut_coordinates,
+        "driving_time_sec":cut_point["driving_time_sec"],
+        "checkIn":checkIn,
+        **stop
+    }
+
+def check_night_sequence(nights:List[dict], daily_driving_limit:float) -> List[dict]:
+    """
+    Re-checks the daily driving totals once every night has been planned independently.
+    Each day drives back from the previous stay to the route, along the route to the cut point, then out to the next stay.
+    The drive back is estimated with the detour out since directions are symmetric enough for short detours.
+
+    Params:
+    - nights (list of dictionaries): nights in chronological order from plan_night
+    - daily_driving_limit (float): max duration in hours to drive in one day
+
+    Returns:
+    - (list of dictionaries): the same nights with day_driving_time_sec and exceeds_limit added. See check_final_day for the drive to the finish
+    """
+
+    driving_limit_sec = daily_driving_limit*60*60
+    previous_detour_sec = 0
+
+    for night in nights:
+        night["day_driving_time_sec"] = previous_detour_sec + night["driving_time_sec"] + night["detour_duration_sec"]
+        night["exceeds_limit"] = night["day_driving_time_sec"] > driving_limit_sec
+        if night["exceeds_limit"]:
+            print(f"Driving on {night['checkIn']} is {night['day_driving_time_sec']/3600:.2f} hours, over the {daily_driving_limit} hour limit")
+        previous_detour_sec = night["detour_duration_sec"]
+
+    return nights
+
+def check_final_day(nights:List[dict], final_leg_sec:float, daily_driving_limit:float) -> dict:
+    """
+    Checks the last day, from the final stay back to the route and on to the finish, which no night covers
+
+    Params:
+    - nights (list of dictionaries): nights in chronological order from plan_night
+    - final_leg_sec (float): driving time along the route from the last cut point to the finish, the whole route if there are no nights
+    - daily_driving_limit (float): max duration in hours to drive in one day
+
+    Returns:
+    - (dict): day_driving_time_sec and exceeds_limit of the last day
+    """
+
+    day_driving_time_sec = (nights[-1]["detour_duration_sec"] if len(nights) > 0 else 0) + final_leg_sec
+    exceeds_limit = day_driving_time_sec > daily_driving_limit*60*60
+    if exceeds_limit:
+        print(f"Driving on the last day is {day_driving_time_sec/3600:.2f} hours, over the {daily_driving_limit} hour limit")
+
+    return {"day_driving_time_sec":day_driving_time_sec, "exceeds_limit":exceeds_limit}
+
+def route_stop(night:dict) -> tuple:
+    """
+    Where a night is spent on the route
+
+    Params:
+    - night (dict): see plan_night
+
+    Returns:
+    - (tuple): lat long of the chosen stay, or of the cut point if no stay was found
+    """
+
+    return night["stay_coordinates"] if night["stay_coordinates"] is not None else night["cut_coordinates"]
+
+def plan_overnight_stays(initial_driving_directions:dict, daily_driving_limit:float, trip_start_date:str, max_workers:int=4) -> List[dict]:
+    """
+    Picks a stay for every night of the trip using only the initial directions, instead of re-routing from each stay to the finish.
+    All overnight cut points come from the one directions response so every night is independent and they are searched concurrently.
+    Directions are requested only for the short detour from each cut point to its chosen stay, and the daily totals,
+    including the last day to the finish, are re-checked afterwards. A night with no stays found does not stop the others.
+
+    Params:
+    - initial_driving_directions (dict): driving directions from start to finish
+    - daily_driving_limit (float): max duration in hours to drive in one day
+    - trip_start_date (str): YYYY-MM-DD
+    - max_workers (int): max number of nights searched at the same time. 1 searches them one after the other
+
+    Returns:
+    - (tuple): the nights, one dictionary per night (see plan_night and check_night_sequence), and the last day (see check_final_day)
+    """
+    date_format = "%Y-%m-%d"
+
+    cut_points = get_overnight_cut_points(initial_driving_directions, daily_driving_limit)
+    first_night = datetime.strptime(trip_start_date, date_format)
+    check_in_dates = [first_night + timedelta(days=night_index) for night_index in range(len(cut_points))]
+    stay_dates = [(checkIn.strftime(date_format), (checkIn + timedelta(days=1)).strftime(date_format)) for checkIn in check_in_dates]
+
+    if len(cut_points) == 0:
+        nights = []
+    elif max_workers is None or max_workers <= 1:
+        nights = [plan_night(cut_point, checkIn, checkOut) for cut_point, (checkIn, checkOut) in zip(cut_points, stay_dates)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(cut_points))) as executor:
+            nights = list(executor.map(lambda night: plan_night(night[0], *night[1]), zip(cut_points, stay_dates)))
+
+    nights = check_night_sequence(nights, daily_driving_limit)
+    total_duration_sec = initial_driving_directions["features"][0]["properties"]["summary"]["duration"]
+    final_day = check_final_day(nights, total_duration_sec - (cut_points[-1]["elapsed_time_sec"] if len(cut_points) > 0 else 0), daily_driving_limit)
+
+    return nights, final_day
+
+def get_route(start_address:str, finish_address:str, daily_driving_limit:float, trip_start_date:str, split_route:bool=True, max_workers:int=4, return_plan:bool=False) -> List[tuple]:
     """
     Get route for the road trip including stops at hotels
 
@@ -14,15 +203,32 @@ def get_route(start_address:str, finish_address:str, daily_driving_limit:float,
     - finish_address (str): free form address where the route ends YYYY-MM-DD
     - daily_driving_limit (float): max duration in hours to drive in one day
     - trip_start_date (str): MM-DD-YYYY
+    - split_route (bool): work out every night from the initial directions (see plan_overnight_stays). False re-routes from each chosen stay to the finish
+    - max_workers (int): max number of nights searched at the same time when split_route is True
+    - return_plan (bool): also return the planned nights and last day, only when split_route is True
 
     Returns:
-    - (list of tuples): coordinates
+    - (list of tuples): coordinates. A night with no stays found is spent at its cut point on the route.
+    With return_plan, a dictionary of the route, the nights and the final_day, see plan_overnight_stays
+
+    Raise:
+    - ValueError if return_plan is asked for without split_route
     """
     date_format = "%Y-%m-%d"
 
-    start_coordinate = get_geocoded_address(start_address)
-    finish_coordinate = get_geocoded_address(finish_address)
+    if return_plan and not split_route:
+        raise ValueError("The plan of each night is only kept when split_route is True")
+
+    start_coordinate, finish_coordinate = get_batch_geocoded_addresses([start_address, finish_address])
     initial_driving_directions = get_driving_directions(start_coordinate, finish_coordinate)
+
+    if split_route:
+        nights, final_day = plan_overnight_stays(initial_driving_directions, daily_driving_limit, trip_start_date, max_workers)
+        route = [start_coordinate] + [route_stop(night) for night in nights] + [finish_coordinate]
+        if return_plan:
+            return {"route":route, "nights":nights, "final_day":final_day}
+        return route
+
     total_trip_duration = initial_driving_directions["features"][0]["properties"]["summary"]["duration"]
     number_driving_days_required = math.ceil(total_trip_duration / (daily_driving_limit*3600))
     copy_driving_directions = initial_driving_directions.copy()
@@ -39,7 +245,7 @@ def get_route(start_address:str, finish_address:str, daily_driving_limit:float,
                 last_coordinates_current_day = get_coordinates_from_waypoints(last_step_current_day, geometry)[1]
                 checkIn = datetime.strptime(trip_start_date, date_format)
                 checkOut = checkIn + timedelta(days=1)
-                accomodation_options = search_all_stays(last_coordinates_current_day, checkIn.strftime(date_format), checkOut.strftime(date_format), range=2000, limit=2)
+                accomodation_options = search_all_stays(last_coordinates_current_day, checkIn.strftime(date_format), checkOut.strftime(date_format), range=2000, limit=HOTEL_PAGE_SIZE, max_pages=SEARCH_MAX_PAGES)
                 best_accomodation = get_best_stay(accomodation_options, last_coordinates_current_day)
                 best_accomodation_coordinates = (best_accomodation["lat"], best_accomodation["long"])
                 final_route_coordinates.append(best_accomodation_coordinates)
@@ -0,0 +1,183 @@
+from api_calls.geocoder.search import get_batch_geocoded_addresses
+from api_calls.openroute_service.directions import get_driving_directions, RouteIndex
+from api_calls.quota import QuotaExceeded
+from getRoadTripRoute import choose_stay, get_detour_sec, check_night_sequence, check_final_day, route_stop
+from rankStays import normalize_ratings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List
+import itertools
+import numpy as np
+
+# overnight stops are searched once per cell of this many decimals (about 1 km) and night, whichever scenario they come from
+STOP_DECIMALS = 2
+
+def _stop_cell(coordinates:tuple) -> tuple:
+    """
+    Snaps a stop to its search cell so nearby cut points from different daily limits share one search
+
+    Params:
+    - coordinates (tuple): lat long
+
+    Returns:
+    - (tuple): rounded lat long, used as the search center
+    """
+
+    return (round(coordinates[0], STOP_DECIMALS), round(coordinates[1], STOP_DECIMALS))
+
+def _try_choose_stay(stop:tuple) -> dict:
+    """
+    Chooses the stay for one distinct stop, keeping the error instead of raising so one failed search does not end the whole sweep
+
+    Params:
+    - stop (tuple): (cell coordinates, checkIn, checkOut)
+
+    Returns:
+    - (dict): see getRoadTripRoute.choose_stay, or error if the search failed
+
+    Raise:
+    - QuotaExceeded, every other stop would run out too
+    """
+
+    coordinates, checkIn, checkOut = stop
+    try:
+        return choose_stay(coordinates, checkIn, checkOut)
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        print(f"Could not plan the stop at {coordinates} on {checkIn}: {e}")
+        return {"error":str(e)}
+
+def _map(func, items:list, max_workers:int) -> list:
+    """
+    Calls func on every item, on up to max_workers threads
+
+    Returns:
+    - (list): results in the order of items
+    """
+
+    if len(items) == 0:
+        return []
+    elif max_workers is None or max_workers <= 1:
+        return [func(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(func, items))
+
+def plan_scenarios(start_address:str, finish_address:str, daily_driving_limits:List[float], trip_start_dates:List[str], max_workers:int=4):
+    """
+    Plans the same trip for every combination of daily driving limit and start date and compares them.
+    The addresses are geocoded and the route is requested once for every scenario. Overnight stops are snapped to STOP_DECIMALS cells
+    and each (cell, night) is searched once, so the number of stay searches grows with the distinct stops rather than the scenarios.
+    The detour to each chosen stay is still measured from the scenario's own cut point, not the cell.
+
+    Params:
+    - start_address (str): free form address where the route starts
+    - finish_address (str): free form address where the route ends
+    - daily_driving_limits (list of floats): max durations in hours to drive in one day
+    - trip_start_dates (list of str): YYYY-MM-DD
+    - max_workers (int): max number of distinct stops searched, and detours requested, at the same time
+
+    Returns:
+    - (pd.DataFrame): one row per scenario with daily_driving_limit, trip_start_date, arrival_date, nights, nights_without_stay, total_driving_time_sec,
+    longest_day_sec, days_over_limit (the last day to the finish included), total_price (NaN unless every night has a stay with a price),
+    mean_rating (0 to 1) of the nights with a stay, route (list of coordinates) and error if a stop could not be planned
+    """
+
+    import pandas as pd
+
+    date_format = "%Y-%m-%d"
+
+    start_coordinate, finish_coordinate = get_batch_geocoded_addresses([start_address, finish_address])
+    route_index = RouteIndex(get_driving_directions(start_coordinate, finish_coordinate))
+    cut_points = {limit:route_index.cut_points(limit) for limit in dict.fromkeys(daily_driving_limits)}
+
+    # each scenario's nights point at a distinct stop, (cell, checkIn, checkOut)
+    scenarios = []
+    for daily_driving_limit, trip_start_date in itertools.product(dict.fromkeys(daily_driving_limits), dict.fromkeys(trip_start_dates)):
+        first_night = datetime.strptime(trip_start_date, date_format)
+        nights = []
+        for night_index, cut_point in enumerate(cut_points[daily_driving_limit]):
+            checkIn = first_night + timedelta(days=night_index)
+            stop = (_stop_cell(cut_point["coordinates"]), checkIn.strftime(date_format), (checkIn + timedelta(days=1)).strftime(date_format))
+            nights.append((cut_point, stop))
+        scenarios.append((daily_driving_limit, trip_start_date, nights))
+
+    # sorted so the nights at one place are searched together and share its listings and calendars
+    stops = sorted({stop for _, _, nights in scenarios for _, stop in nights})
+    print(f"Planning {len(scenarios)} scenarios from {len(stops)} distinct stops")
+    planned_stops = dict(zip(stops, _map(_try_choose_stay, stops, max_workers)))
+
+    # the stay is searched from the cell but the drive to it starts where the day's driving really ends
+    detour_legs = list(dict.fromkeys(
+        (cut_point["coordinates"], planned_stops[stop]["stay_coordinates"])
+        for _, _, nights in scenarios for cut_point, stop in nights
+        if planned_stops[stop].get("stay_coordinates") is not None
+    ))
+    detours = dict(zip(detour_legs, _map(lambda leg: get_detour_sec(*leg), detour_legs, max_workers)))
+
+    rows = []
+    for daily_driving_limit, trip_start_date, scenario_nights in scenarios:
+        first_night = datetime.strptime(trip_start_date, date_format)
+        row = {
+            "daily_driving_limit":daily_driving_limit,
+            "trip_start_date":trip_start_date,
+            "arrival_date":(first_night + timedelta(days=len(scenario_nights))).strftime(date_format),
+            "nights":len(scenario_nights),
+            "error":None
+        }
+
+        errors = [planned_stops[stop]["error"] for _, stop in scenario_nights if "error" in planned_stops[stop]]
+        if len(errors) > 0:
+            row["error"] = errors[0]
+            rows.append(row)
+            continue
+
+        nights = [
+            {
+                "cut_coordinates":cut_point["coordinates"],
+                "driving_time_sec":cut_point["driving_time_sec"],
+                "checkIn":stop[1],
+                **planned_stops[stop],
+                "detour_duration_sec":detours.get((cut_point["coordinates"], planned_stops[stop]["stay_coordinates"]), 0)
+            }
+            for cut_point, stop in scenario_nights
+        ]
+        nights = check_night_sequence(nights, daily_driving_limit)
+
+        # the last day drives back from the final stay to the route and on to the finish
+        last_cut_sec = scenario_nights[-1][0]["elapsed_time_sec"] if len(nights) > 0 else 0
+        final_day = check_final_day(nights, route_index.total_duration_sec - last_cut_sec, daily_driving_limit)
+        days = nights + [final_day]
+        day_driving_sec = [day["day_driving_time_sec"] for day in days]
+
+        stays = [night["stay"] for night in nights if night["stay"] is not None]
+        prices = np.array([stay["price"] for stay in stays], dtype=np.float64)
+        ratings = normalize_ratings([stay["avgGuestRating"] for stay in stays], [stay["stayType"] for stay in stays])
+
+        row.update(
+            {
+                "nights_without_stay":len(nights) - len(stays),
+                "total_driving_time_sec":float(sum(day_driving_sec)),
+                "longest_day_sec":float(max(day_driving_sec)),
+                "days_over_limit":int(sum(day["exceeds_limit"] for day in days)),
+                "total_price":float(prices.sum()) if len(stays) == len(nights) else float("nan"),
+                "mean_rating":float(ratings.mean()) if len(stays) > 0 else float("nan"),
+                "route":[start_coordinate] + [route_stop(night) for night in nights] + [finish_coordinate]
+            }
+        )
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+if __name__=="__main__":
+    args = {
+        "start_address":"1709 F Street Bellingham Washington",
+        "finish_address":"820 15 Ave SW Calgary Alberta",
+        "daily_driving_limits":[5, 6, 7],
+        "trip_start_dates":["2025-03-24", "2025-03-25"]
+        }
+
+    scenarios = plan_scenarios(**args)
+
+    print(scenarios.drop(columns="route").to_string())
@@ -0,0 +1,142 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(lats, longs, lat:float, long:float) -> np.ndarray:
+    """
+    Great-circle distance from many points to one point, computed over whole arrays at once.
+
+    Params:
+    - lats (array-like): latitudes of the points, in degrees
+    - longs (array-like): longitudes of the points, in degrees
+    - lat (float): latitude of the point to measure to
+    - long (float): longitude of the point to measure to
+
+    Returns:
+    - (np.ndarray): distances in kilometres
+    """
+
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    longs = np.radians(np.asarray(longs, dtype=np.float64))
+    lat = np.radians(lat)
+    long = np.radians(long)
+
+    a = np.sin((lats-lat)/2)**2 + np.cos(lats)*np.cos(lat)*np.sin((longs-long)/2)**2
+
+    return 2*EARTH_RADIUS_KM*np.arcsin(np.sqrt(a))
+
+# max value of each provider's rating scale: priceline overallGuestRating is out of 10, airbnb starRating is out of 5
+RATING_SCALES = {
+    "hotel": 10.0,
+    "airbnb": 5.0
+}
+
+# relative importance of each part of the composite score
+DEFAULT_WEIGHTS = {
+    "distance": 0.5,
+    "rating": 0.35,
+    "price": 0.15
+}
+
+def normalize_ratings(ratings, stay_types) -> np.ndarray:
+    """
+    Puts every provider's rating on a 0 to 1 scale
+
+    Params:
+    - ratings (array-like): avgGuestRating values, each on its provider's own scale
+    - stay_types (array-like): stayType of each rating, a key of RATING_SCALES
+
+    Returns:
+    - (np.ndarray): ratings between 0 and 1. Missing ratings score 0
+    """
+
+    ratings = np.asarray(ratings, dtype=np.float64)
+    stay_types = np.asarray(stay_types)
+
+    scales = np.full(ratings.shape, np.nan)
+    for stay_type, scale in RATING_SCALES.items():
+        scales[stay_types == stay_type] = scale
+
+    normalized = np.clip(ratings/scales, 0, 1)
+
+    return np.nan_to_num(normalized, nan=0.0)
+
+def normalize_prices(prices) -> np.ndarray:
+    """
+    Scores prices between 0 and 1 where the cheapest stay scores 1 and the most expensive scores 0
+
+    Params:
+    - prices (array-like): nightly prices
+
+    Returns:
+    - (np.ndarray): price scores. Missing prices get a neutral 0.5
+    """
+
+    prices = np.asarray(prices, dtype=np.float64)
+    known = ~np.isnan(prices)
+
+    scores = np.full(prices.shape, 0.5)
+    if known.any():
+        low = prices[known].min()
+        spread = prices[known].max() - low
+        scores[known] = 1.0 if spread == 0 else 1 - (prices[known]-low)/spread
+
+    return scores
+
+def score_stays(df, centroid:tuple, weights:dict=None, max_distance_km:float=None) -> np.ndarray:
+    """
+    Scores every stay in one pass over the columns of the stays DataFrame
+
+    Params:
+    - df (pd.DataFrame): stays with lat, long, avgGuestRating and stayType columns, and optionally price
+    - centroid (tuple): stop point as lat, long
+    - weights (dict): weight for the distance, rating and price scores. Defaults to DEFAULT_WEIGHTS
+    - max_distance_km (float): distance that scores 0. Defaults to the furthest stay
+
+    Returns:
+    - (np.ndarray): composite scores, higher is better, in the row order of df
+    """
+
+    weights = DEFAULT_WEIGHTS if weights is None else weights
+
+    distances_km = haversine_km(df["lat"].to_numpy(), df["long"].to_numpy(), centroid[0], centroid[1])
+    if max_distance_km is None:
+        max_distance_km = distances_km.max() if len(distances_km) else 0
+    distance_scores = 1 - np.clip(distances_km/max_distance_km, 0, 1) if max_distance_km > 0 else np.ones(distances_km.shape)
+
+    rating_scores = normalize_ratings(df["avgGuestRating"].to_numpy(), df["stayType"].to_numpy())
+
+    if "price" in df:
+        price_scores = normalize_prices(df["price"].to_numpy())
+    else:
+        price_scores = np.full(distances_km.shape, 0.5)
+
+    return weights["distance"]*distance_scores + weights["rating"]*rating_scores + weights["price"]*price_scores
+
+def top_k_stays(df, centroid:tuple, k:int=5, weights:dict=None, max_distance_km:float=None):
+    """
+    Gets the k best scoring stays without sorting every candidate
+
+    Params:
+    - df (pd.DataFrame): stays, see score_stays
+    - centroid (tuple): stop point as lat, long
+    - k (int): number of stays to return
+    - weights (dict): see score_stays
+    - max_distance_km (float): see score_stays
+
+    Returns:
+    - (pd.DataFrame): the k best stays, best first, with score and distanceKm columns added
+    """
+
+    scores = score_stays(df, centroid, weights, max_distance_km)
+    k = min(k, len(scores))
+
+    # argpartition finds the k best in linear time, then only those k get sorted
+    best = np.argpartition(-scores, k-1)[:k] if k > 0 else np.array([], dtype=np.intp)
+    best = best[np.argsort(-scores[best], kind="stable")]
+
+    top = df.iloc[best].copy()
+    top["score"] = scores[best]
+    top["distanceKm"] = haversine_km(top["lat"].to_numpy(), top["long"].to_numpy(), centroid[0], centroid[1])
+
+    return top
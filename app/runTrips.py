@@ -0,0 +1,200 @@
+from api_calls.cache import make_key
+from api_calls.quota import QuotaExceeded
+from getRoadTripRoute import get_route
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, ALL_COMPLETED
+from typing import Iterator
+import os
+import json
+import time
+import argparse
+import threading
+
+# fields every trip request must have, passed straight to get_route
+TRIP_FIELDS = ("start_address", "finish_address", "daily_driving_limit", "trip_start_date")
+
+def trip_id(trip:dict) -> str:
+    """
+    Identifies a trip request so it can be skipped once its result is written
+
+    Params:
+    - trip (dict): one trip request
+
+    Returns:
+    - (str): the request's own trip_id, otherwise a key built from its TRIP_FIELDS so the same trip always gets the same id
+    """
+
+    if trip.get("trip_id") is not None:
+        return str(trip["trip_id"])
+
+    return make_key("trip", {field:trip.get(field) for field in TRIP_FIELDS})
+
+def read_trips(input_path:str) -> Iterator[dict]:
+    """
+    Streams trip requests from a JSONL file, one line at a time so the whole file is never held in memory
+
+    Params:
+    - input_path (str): one json object per line with TRIP_FIELDS and optionally trip_id
+
+    Returns:
+    - (iterator of dictionaries): trips with trip_id set, lines missing a field are reported and skipped
+    """
+
+    with open(input_path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            if line.strip() == "":
+                continue
+            try:
+                trip = json.loads(line)
+            except ValueError:
+                print(f"Line {line_number} of {input_path} is not valid json, skipping it")
+                continue
+
+            missing = [field for field in TRIP_FIELDS if field not in trip]
+            if len(missing) > 0:
+                print(f"Line {line_number} of {input_path} is missing {missing}, skipping it")
+                continue
+
+            yield dict(trip, trip_id=trip_id(trip))
+
+def read_finished(output_path:str, retry_failed:bool=False) -> set:
+    """
+    Finds the trips already written to the output, the checkpoint a restarted run resumes from
+
+    Params:
+    - output_path (str): JSONL file written by run_trips
+    - retry_failed (bool): leave trips whose last result was an error out of the set so they are planned again
+
+    Returns:
+    - (set): trip ids to skip
+    """
+
+    if not os.path.exists(output_path):
+        return set()
+
+    # a trip retried after an error has several lines, the last one counts
+    statuses = {}
+    with open(output_path, "r") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # the last line is cut short if the previous run was killed while writing it
+                continue
+            statuses[result["trip_id"]] = result["status"]
+
+    return {trip_id for trip_id, status in statuses.items() if status == "ok" or not retry_failed}
+
+def plan_trip(trip:dict, night_workers:int=1) -> dict:
+    """
+    Plans one trip request, keeping the error instead of raising so the rest of the batch carries on
+
+    Params:
+    - trip (dict): one trip from read_trips
+    - night_workers (int): max number of one trip's nights searched at the same time
+
+    Returns:
+    - (dict): trip_id, status (ok or error), the trip request, route (list of lat long coordinates),
+    days_over_limit (number of days, the last one included, driving longer than the daily limit), error and elapsed_sec
+    """
+
+    start = time.perf_counter()
+    result = {"trip_id":trip["trip_id"], "status":"ok", "trip":{field:trip[field] for field in TRIP_FIELDS}, "route":None, "days_over_limit":None, "error":None}
+
+    try:
+        plan = get_route(trip["start_address"], trip["finish_address"], float(trip["daily_driving_limit"]), trip["trip_start_date"], max_workers=night_workers, return_plan=True)
+        result["route"] = [list(coordinates) for coordinates in plan["route"]]
+        result["days_over_limit"] = int(sum(day["exceeds_limit"] for day in plan["nights"] + [plan["final_day"]]))
+    except QuotaExceeded:
+        # the whole batch is out of budget, let run_trips stop submitting trips
+        raise
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["elapsed_sec"] = round(time.perf_counter() - start, 3)
+
+    return result
+
+def run_trips(input_path:str, output_path:str, max_workers:int=4, night_workers:int=1, retry_failed:bool=False) -> dict:
+    """
+    Plans every trip in a JSONL file on a bounded thread pool and appends each result to a JSONL file as soon as it finishes.
+    All workers share one response cache, listing store and quota budget. Trips already in the output are skipped,
+    so a run that crashed or ran out of quota carries on where it stopped when started again with the same files.
+    Only max_workers*2 trips are read ahead, so a file of any size is streamed.
+
+    Params:
+    - input_path (str): trip requests, see read_trips
+    - output_path (str): results, see plan_trip. Created if missing, appended to otherwise
+    - max_workers (int): max number of trips planned at the same time
+    - night_workers (int): max number of one trip's nights searched at the same time
+    - retry_failed (bool): plan trips whose last result was an error again
+
+    Returns:
+    - (dict): number of trips planned ok, failed, skipped as already finished, and if the run stopped early for lack of quota
+    """
+
+    finished = read_finished(output_path, retry_failed)
+    counts = {"ok":0, "error":0, "skipped":0, "quota_exceeded":False}
+    write_lock = threading.Lock()
+
+    # a killed run can leave a partial last line, start the next result on a line of its own
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    else:
+        needs_newline = False
+
+    with open(output_path, "a") as output, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if needs_newline:
+            output.write("\n")
+
+        def write_result(result:dict) -> None:
+            with write_lock:
+                output.write(json.dumps(result) + "\n")
+                # flushed per trip so a crash loses at most the trips still in flight
+                output.flush()
+                counts[result["status"]] += 1
+            print(f"{result['trip_id'][:16]} {result['status']} in {result['elapsed_sec']}s")
+
+        def collect(futures:set, return_when) -> set:
+            done, pending = wait(futures, return_when=return_when)
+            for future in done:
+                try:
+                    write_result(future.result())
+                except QuotaExceeded as e:
+                    if not counts["quota_exceeded"]:
+                        print(f"Out of quota, stopping after the trips in flight: {e}")
+                    counts["quota_exceeded"] = True
+            return pending
+
+        in_flight = set()
+        for trip in read_trips(input_path):
+            if trip["trip_id"] in finished:
+                counts["skipped"] += 1
+                continue
+            if counts["quota_exceeded"]:
+                break
+            # one more trip is read only when a slot is free
+            finished.add(trip["trip_id"])
+            in_flight.add(executor.submit(plan_trip, trip, night_workers))
+            if len(in_flight) >= max_workers*2:
+                in_flight = collect(in_flight, FIRST_COMPLETED)
+
+        if len(in_flight) > 0:
+            collect(in_flight, ALL_COMPLETED)
+
+    return counts
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Plan many road trips from a JSONL file of trip requests")
+    parser.add_argument("input", help="JSONL file, one trip per line with start_address, finish_address, daily_driving_limit, trip_start_date and optionally trip_id")
+    parser.add_argument("output", help="JSONL file of results, trips already in it are skipped")
+    parser.add_argument("--workers", type=int, default=4, help="trips planned at the same time")
+    parser.add_argument("--night-workers", type=int, default=1, help="nights of one trip searched at the same time")
+    parser.add_argument("--retry-failed", action="store_true", help="plan trips that failed in an earlier run again")
+    args = parser.parse_args()
+
+    counts = run_trips(args.input, args.output, args.workers, args.night_workers, args.retry_failed)
+
+    print(counts)
@@ -0,0 +1,225 @@
+from api_calls.openroute_service.directions import RouteIndex, KM_PER_DEGREE_LAT
+from api_calls.airbnb.search import MAX_RANGE_M
+from searchStays import search_all_stays, STAY_PROVIDERS
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List
+import math
+import numpy as np
+
+# stays further than this from the road, either side, are too far a detour to count as on the route
+CORRIDOR_HALF_WIDTH_KM = 5
+
+# a night can end anywhere in the last this many hours of driving before the daily limit
+FEASIBLE_WINDOW_HOURS = 1.5
+
+# every provider search is a circle of the largest radius airbnb accepts
+SEARCH_RADIUS_KM = MAX_RANGE_M/1000
+
+# circles added to a window whose corridor is still not covered, eg. on tight bends, before giving up
+MAX_EXTRA_CIRCLES = 10
+
+# search pages fetched from each provider per circle, up to 150 airbnbs and 3 pages of priceline hotels
+CORRIDOR_MAX_PAGES = 3
+
+def _to_km(coords:np.ndarray, origin_lat:float) -> np.ndarray:
+    """
+    Projects long, lat onto a flat plane in kilometres, accurate enough over the length of one day's window
+
+    Params:
+    - coords (np.ndarray): n x 2 array of (long, lat)
+    - origin_lat (float): latitude where east-west distances are measured
+
+    Returns:
+    - (np.ndarray): n x 2 array of (x, y) in kilometres
+    """
+
+    scale = np.array([KM_PER_DEGREE_LAT*np.cos(np.radians(origin_lat)), KM_PER_DEGREE_LAT])
+
+    return np.asarray(coords, dtype=np.float64)*scale
+
+def _from_km(xy:np.ndarray, origin_lat:float) -> np.ndarray:
+    """
+    Reverses _to_km
+
+    Returns:
+    - (np.ndarray): n x 2 array of (long, lat)
+    """
+
+    scale = np.array([KM_PER_DEGREE_LAT*np.cos(np.radians(origin_lat)), KM_PER_DEGREE_LAT])
+
+    return np.asarray(xy, dtype=np.float64)/scale
+
+def cover_corridor(line_km:np.ndarray, radius_km:float=SEARCH_RADIUS_KM, half_width_km:float=CORRIDOR_HALF_WIDTH_KM) -> tuple:
+    """
+    Places the fewest search circles along a stretch of road that together cover the corridor around it.
+    A circle of radius r centred on the road covers a strip of half width w for 2*sqrt(r²-w²) along the road,
+    so the circles are spread evenly at no more than that spacing, and more are added if bends leave part of the corridor uncovered.
+
+    Params:
+    - line_km (np.ndarray): n x 2 array of the road in kilometres, see _to_km
+    - radius_km (float): search radius
+    - half_width_km (float): corridor width either side of the road, must be less than radius_km
+
+    Returns:
+    - (tuple): circle centres as an n x 2 array in kilometres, and the corridor as a shapely polygon in kilometres
+    """
+
+    import shapely
+
+    if half_width_km >= radius_km:
+        raise ValueError(f"Corridor half width {half_width_km} km does not fit in a {radius_km} km search circle")
+
+    line = shapely.LineString(line_km) if len(line_km) > 1 else shapely.Point(line_km[0])
+    corridor = line.buffer(half_width_km, cap_style="flat") if line.length > 0 else line.buffer(half_width_km)
+    spacing_km = 2*math.sqrt(radius_km**2 - half_width_km**2)
+    n_circles = max(1, math.ceil(line.length/spacing_km))
+
+    for n in range(n_circles, n_circles + MAX_EXTRA_CIRCLES + 1):
+        distances_km = (np.arange(n) + 0.5)*line.length/n
+        centers = shapely.line_interpolate_point(line, distances_km) if line.length > 0 else shapely.points([line_km[0]])
+        circles = shapely.buffer(centers, radius_km)
+        if shapely.union_all(circles).contains(corridor):
+            break
+    else:
+        print(f"{n} search circles still leave part of a {line.length:.0f} km corridor uncovered")
+
+    return shapely.get_coordinates(centers), corridor
+
+def plan_corridor(directions, daily_driving_limit:float, trip_start_date:str, half_width_km:float=CORRIDOR_HALF_WIDTH_KM, window_hours:float=FEASIBLE_WINDOW_HOURS) -> List[dict]:
+    """
+    Works out each night's feasible window along the route and the search circles covering it, without calling any provider
+
+    Params:
+    - directions (dict or RouteIndex): driving directions from start to finish, or the RouteIndex already built from them
+    - daily_driving_limit (float): max duration in hours to drive in one day
+    - trip_start_date (str): YYYY-MM-DD
+    - half_width_km (float): corridor width either side of the road
+    - window_hours (float): hours before the daily limit a night can end
+
+    Returns:
+    - (list of dictionaries): one per night with checkIn, checkOut, window_start_sec and window_end_sec of driving since the trip start,
+    origin_lat of the km projection, line_km of the window, the corridor polygon in km and search_centers as lat long tuples
+    """
+
+    date_format = "%Y-%m-%d"
+
+    route_index = directions if isinstance(directions, RouteIndex) else RouteIndex(directions)
+    cut_points = route_index.cut_points(daily_driving_limit, interpolate=True)
+    first_night = datetime.strptime(trip_start_date, date_format)
+
+    nights = []
+    previous_cut_sec = 0.0
+    for night_index, cut_point in enumerate(cut_points):
+        window_end_sec = cut_point["elapsed_time_sec"]
+        window_start_sec = max(window_end_sec - window_hours*60*60, previous_cut_sec)
+        line = route_index.line_between(window_start_sec, window_end_sec)
+        origin_lat = float(line[:, 1].mean())
+        centers_km, corridor = cover_corridor(_to_km(line, origin_lat), SEARCH_RADIUS_KM, half_width_km)
+        checkIn = first_night + timedelta(days=night_index)
+
+        nights.append(
+            {
+                "checkIn":checkIn.strftime(date_format),
+                "checkOut":(checkIn + timedelta(days=1)).strftime(date_format),
+                "window_start_sec":window_start_sec,
+                "window_end_sec":window_end_sec,
+                "origin_lat":origin_lat,
+                "line_km":_to_km(line, origin_lat),
+                "corridor":corridor,
+                "search_centers":[(float(lat), float(long)) for long, lat in _from_km(centers_km, origin_lat)]
+            }
+        )
+        previous_cut_sec = window_end_sec
+
+    return nights
+
+def _assign_stays(night:dict, frames:list):
+    """
+    Keeps the stays found by a night's circles that are inside its corridor, once each, with where they are along the window
+
+    Params:
+    - night (dict): see plan_corridor
+    - frames (list of pd.DataFrame): search_all_stays results of the night's circles
+
+    Returns:
+    - (pd.DataFrame): stays with distanceToRouteKm and windowShare, 0 at the start of the window and 1 at the daily limit
+    """
+
+    import pandas as pd
+    import shapely
+
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 0 else pd.DataFrame(columns=["accomodationId", "stayType", "lat", "long"])
+    df = df.drop_duplicates(subset=["stayType", "accomodationId"]).reset_index(drop=True)
+    if len(df) == 0:
+        return df.assign(distanceToRouteKm=pd.Series(dtype="float64"), windowShare=pd.Series(dtype="float64"))
+
+    points = shapely.points(_to_km(np.column_stack([df["long"].to_numpy(dtype=np.float64), df["lat"].to_numpy(dtype=np.float64)]), night["origin_lat"]))
+    shapely.prepare(night["corridor"])
+    inside = shapely.contains(night["corridor"], points)
+
+    line = shapely.LineString(night["line_km"]) if len(night["line_km"]) > 1 else shapely.Point(night["line_km"][0])
+    df["distanceToRouteKm"] = shapely.distance(line, points)
+    df["windowShare"] = shapely.line_locate_point(line, points, normalized=True) if line.length > 0 else 1.0
+
+    return df[inside].reset_index(drop=True)
+
+def search_corridor(directions, daily_driving_limit:float, trip_start_date:str, half_width_km:float=CORRIDOR_HALF_WIDTH_KM, window_hours:float=FEASIBLE_WINDOW_HOURS, limit:int=20, max_workers:int=4, max_pages:int=CORRIDOR_MAX_PAGES) -> List[dict]:
+    """
+    Searches stays along the whole route at once instead of at one point per night.
+    Each night's feasible window of road is covered by the fewest SEARCH_RADIUS_KM circles (see cover_corridor),
+    every circle of every night is searched in one batch, and then the stays are assigned to their night's corridor locally.
+    Each circle pages through every provider's results until a page comes back short, up to max_pages per provider,
+    so the search calls are at most circles x providers x max_pages, known from the route before any is sent.
+    A circle that fills its whole page budget may still leave stays out. Every airbnb found then adds up to one calendar
+    and one details call, fewer for listings already in the listing store, which the search calls cannot bound.
+
+    Params:
+    - directions (dict or RouteIndex): driving directions from start to finish, or the RouteIndex already built from them
+    - daily_driving_limit (float): max duration in hours to drive in one day
+    - trip_start_date (str): YYYY-MM-DD
+    - half_width_km (float): corridor width either side of the road
+    - window_hours (float): hours before the daily limit a night can end
+    - limit (int): number of priceline results per page
+    - max_workers (int): max number of circles searched at the same time
+    - max_pages (int): budget of search pages from each provider per circle
+
+    Returns:
+    - (list of dictionaries): the nights from plan_corridor, each with stays (pd.DataFrame, see _assign_stays)
+    and max_search_calls, the most search calls its circles can send
+    """
+
+    nights = plan_corridor(directions, daily_driving_limit, trip_start_date, half_width_km, window_hours)
+    circles = [(night_index, center) for night_index, night in enumerate(nights) for center in night["search_centers"]]
+    for night in nights:
+        night["max_search_calls"] = len(night["search_centers"])*len(STAY_PROVIDERS)*max_pages
+    print(f"Searching {len(circles)} circles along the corridor for {len(nights)} nights, at most {sum(night['max_search_calls'] for night in nights)} search calls")
+
+    def search_circle(circle:tuple):
+        night_index, center = circle
+        night = nights[night_index]
+        return search_all_stays(center, night["checkIn"], night["checkOut"], range=MAX_RANGE_M, limit=limit, max_pages=max_pages)
+
+    if len(circles) == 0:
+        frames = []
+    elif max_workers is None or max_workers <= 1:
+        frames = [search_circle(circle) for circle in circles]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(circles))) as executor:
+            frames = list(executor.map(search_circle, circles))
+
+    for night_index, night in enumerate(nights):
+        night_frames = [frame for (circle_night, _), frame in zip(circles, frames) if circle_night == night_index and len(frame) > 0]
+        night["stays"] = _assign_stays(night, night_frames)
+
+    return nights
+
+if __name__=="__main__":
+    from api_calls.geocoder.search import get_batch_geocoded_addresses
+    from api_calls.openroute_service.directions import get_driving_directions
+
+    start_coordinate, finish_coordinate = get_batch_geocoded_addresses(["1709 F Street Bellingham Washington", "820 15 Ave SW Calgary Alberta"])
+    nights = search_corridor(get_driving_directions(start_coordinate, finish_coordinate), 7, "2025-03-25")
+
+    for night in nights:
+        print(night["checkIn"], len(night["search_centers"]), "circles", len(night["stays"]), "stays")
@@ -1,9 +1,14 @@
-from app.api_calls.openroute_service.isochrone import get_isochrone, calculate_isochrone_box
-from searchDrivingDirections import search as search_directions
-from shapely import Point, Polygon 
+from api_calls.openroute_service.isochrone import get_isochrones, Isochrone, KM_PER_DEGREE_LAT
+from api_calls.openroute_service.directions import get_duration_matrix
+import numpy as np
+from typing import List
+
+# square kilometres of isochrone per estimated stay location, so bigger isochrones get more estimates
+KM2_PER_ESTIMATE = 25
 
 def simple_demo() -> bool:
     """demo shapely lib - determine if a point is inside a polygon"""
+    from shapely import Point, Polygon
     area = Polygon([(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)])
     result = area.contains(Point(0.5, 2))
     return result
@@ -15,83 +20,130 @@ def simple_demo() -> bool:
     # the limits for these apis are low whereas openrouteservice (500 isochrones/day) and geoapify limits are high
 
 
-def search(coordinates_a:tuple, coordinates_b:tuple, n_estimates:int=30):
+def estimate_grid(isochrone:Isochrone, min_estimates:int=30, max_estimates:int=500) -> np.ndarray:
     """
-    Find the point within an geomteric polygon that is closest, by driving, to another point inside or outside of the polygon.
+    Grids the box around an isochrone and keeps the grid points inside it. 
+    The grid spacing adapts to the isochrone's area so about one point falls in every KM2_PER_ESTIMATE square kilometres.
+
+    Params:
+    - isochrone (Isochrone): parsed isochrone area
+    - min_estimates (int): fewest grid points to place inside a small isochrone
+    - max_estimates (int): most grid points to place inside a large isochrone
+
+    Returns:
+    - (np.ndarray): n x 2 array of (long, lat) grid points inside the isochrone
     """
-    # determine if the coordinates are inside the polygon
-    
-    
-    result=None
 
-    return result
+    min_lon, min_lat, max_lon, max_lat = isochrone.bounds
+    km_per_degree_lon = KM_PER_DEGREE_LAT*np.cos(np.radians((min_lat+max_lat)/2))
+    area_km2 = isochrone.area_km2
 
-if __name__=="__main__":
+    n_estimates = int(np.clip(area_km2/KM2_PER_ESTIMATE, min_estimates, max_estimates))
+    spacing_km = np.sqrt(area_km2/n_estimates)
 
-    addresses = [
-        "1709 F Street bellingham wa"
-        , "125 N Samish Way, Bellingham, WA 98225"
-        , "1009 Larrabee Ave, Bellingham, WA 98225"
-        ]
-    
-    
-    
-    directions = search_directions(addresses)
+    # split the lat and long ranges into estimator coordinates and cross combine them into a grid
+    lons = np.arange(min_lon, max_lon, spacing_km/km_per_degree_lon) + spacing_km/km_per_degree_lon/2
+    lats = np.arange(min_lat, max_lat, spacing_km/KM_PER_DEGREE_LAT) + spacing_km/KM_PER_DEGREE_LAT/2
+    grid_lons, grid_lats = np.meshgrid(lons, lats)
+    grid = np.column_stack([grid_lons.ravel(), grid_lats.ravel()])
 
-    # get the coordinate for the last step from directions
-        # find the last step by evaluating the running total of duration per day and get it's coordinates
+    # one vectorized point in polygon test over the whole grid
+    estimates = grid[isochrone.contains_many(grid)]
 
-    last_step_lat = 49.987 #eg
-    last_step_lon = -110.65 #eg
+    if len(estimates) > max_estimates:
+        # thin the grid evenly rather than cutting off its northern rows
+        estimates = estimates[np.linspace(0, len(estimates)-1, max_estimates).astype(np.intp)]
 
-    max_daily_hours = 7
-    last_step_running_duration = 6.4
+    return estimates
 
-    # get isochrone for the last step equal to the size of the remaining drive time for the day
-    search_radius = max_daily_hours-last_step_running_duration # hours
-    isochrone = search_isochrone([[last_step_lat, last_step_lon]], [search_radius])
+def _best_estimate(isochrone:Isochrone, coordinates_a:tuple, coordinates_b:tuple, min_estimates:int, max_estimates:int) -> dict:
+    """
+    Scores the grid points inside one isochrone with one duration matrix request, see search
 
-    # next step lat and long
-    next_step_lat = 49.783
-    next_step_lon = -110.641
+    Returns:
+    - (dict): see search
+    """
 
-    # find a box that fits the isochrone: furthest north, east, south, west based on isochrone extremes
+    estimates = estimate_grid(isochrone, min_estimates, max_estimates)
 
-    # for range of coordinates in the isochrone-box:
-        # split lat range into n parts to get estimator lat coordinates
-        # split lon range into n parts to get estimator lon coordinates
+    if len(estimates) == 0:
+        # the isochrone is too thin for the grid, fall back to its starting point
+        estimates = np.array([[coordinates_a[1], coordinates_a[0]]])
 
-    # cross combine these coordinates into a matrix
-    # use this matrix of coordinates for the search points
-        # for each coordinate:
-            # check if the coord is in the isochrone using shapely. 
-                # if not, move on, 
-                # if yes, 
-                    # check driving duration to the next step (ie. from estimated stay location to the next step) for the next day
-                    # store this data
+    sources = [(lat, lon) for lon, lat in estimates.tolist()]
+    durations = get_duration_matrix(sources, [coordinates_b])
+    durations = np.array([np.inf if row[0] is None else row[0] for row in durations], dtype=np.float64)
 
-    # select the coordinates with the shortest duration to the next day's first step
+    if np.isinf(durations).all():
+        return None
 
+    best = int(np.argmin(durations))
+    result = {
+        "coordinates":sources[best],
+        "duration_sec":float(durations[best]),
+        "n_estimates":len(sources)
+    }
 
+    return result
 
+def search_many(searches:List[tuple], min_estimates:int=30, max_estimates:int=500) -> List[dict]:
+    """
+    Runs many searches, see search. Every isochrone is fetched up front in one get_isochrones batch,
+    so the searches share tiles and multi-location calls instead of requesting one isochrone each
 
+    Params:
+    - searches (list of tuples): (coordinates_a, coordinates_b, driving_hours) of each search
+    - min_estimates (int): fewest estimated locations to score, see estimate_grid
+    - max_estimates (int): most estimated locations to score, see estimate_grid
 
+    Returns:
+    - (list of dictionaries): see search, one per search in the order of searches
+    """
 
+    isochrones = get_isochrones([((coordinates_a[1], coordinates_a[0]), driving_hours) for coordinates_a, _, driving_hours in searches])
 
+    return [
+        _best_estimate(isochrone, coordinates_a, coordinates_b, min_estimates, max_estimates)
+        for isochrone, (coordinates_a, coordinates_b, _) in zip(isochrones, searches)
+    ]
 
+def search(coordinates_a:tuple, coordinates_b:tuple, driving_hours:float, min_estimates:int=30, max_estimates:int=500) -> dict:
+    """
+    Find the point within the area reachable from coordinates_a in driving_hours that is closest, by driving, to coordinates_b.
+    Grid points inside the isochrone are scored with one duration matrix request. Use search_many for several at once
+
+    Params:
+    - coordinates_a (tuple): lat long of today's last step, the center of the isochrone
+    - coordinates_b (tuple): lat long of the next day's first step
+    - driving_hours (float): driving time left in the day, defines the isochrone
+    - min_estimates (int): fewest estimated locations to score, see estimate_grid
+    - max_estimates (int): most estimated locations to score, see estimate_grid
+
+    Returns:
+    - (dict): coordinates (lat, long) of the best point, its duration_sec to coordinates_b and n_estimates scored.
+    None if no point in the isochrone can be routed to coordinates_b
+    """
+
+    return search_many([(coordinates_a, coordinates_b, driving_hours)], min_estimates, max_estimates)[0]
+
+if __name__=="__main__":
+
+    # get the coordinate for the last step from directions
+        # find the last step by evaluating the running total of duration per day and get it's coordinates
+
+    last_step_lat = 49.987 #eg
+    last_step_lon = -110.65 #eg
+
+    max_daily_hours = 7
+    last_step_running_duration = 6.4
+
+    # get isochrone for the last step equal to the size of the remaining drive time for the day
+    search_radius = max_daily_hours-last_step_running_duration # hours
 
-    # is_in_isochrone = isochrone.contains(seed_coordinate)
-    
+    # next step lat and long
+    next_step_lat = 49.783
+    next_step_lon = -110.641
 
-    # method:
-        # take the coordinates for today's last step and tomorrow's first step
-        
-        # using the running daily driving duration up to and including the last step, get an isochrone with duration = daily max duration - last step running total  
-            # this gives you an area around the last driving step that keeps your total driving time just under the maximum daily limit
-        
-        # now using the coordinates for the next day's first step, iterate over some coordinates in the isochrone to estimate which coordinate within the isochrone minimize the distance to the next day's first step
-            # for each estimated coordinate, find the directions to the next day's first step
-            # do this n times (at least 5) - or scale with the size of the isochrone!
-            # choose the coordinates with the shortest drive time to the next days first step, and search there for stays. 
+    best = search((last_step_lat, last_step_lon), (next_step_lat, next_step_lon), search_radius)
 
-# using the isochrone returned from the api call, search within the polygon by using shapely's contains(polygon, point)
\ No newline at end of file
+    print(best)
@@ -1,11 +1,78 @@
-from api_calls.airbnb.search import main as search_airbnb
-from api_calls.priceline.search import main as search_priceline
-from api_calls.openroute_service.directions import get_driving_directions
-import pandas as pd
+from api_calls.airbnb.search import main as search_airbnb, to_stay as airbnb_to_stay, iter_airbnbs
+from api_calls.priceline.search import iter_priceline_stays
+from api_calls.stays import Stay, stays_to_frame
+from api_calls.quota import QuotaExceeded
+from api_calls.openroute_service.directions import get_duration_matrix
+from rankStays import normalize_ratings, top_k_stays
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import time
+import queue
+import threading
+import numpy as np
+from typing import List, Iterator
 
-def search_all_stays(coordinates:tuple, checkIn:str, checkOut:str, range:int=500, limit:int=5, page:int=1) -> pd.DataFrame:
+# default budget of search pages fetched from each provider per search, raise it for deeper result sets at the cost of more of the monthly quota
+SEARCH_MAX_PAGES = 1
+
+def search_hotel_stays(coordinates:tuple, checkIn:str, checkOut:str, range:int=500, limit:int=5, page:int=1, max_pages:int=SEARCH_MAX_PAGES) -> List[Stay]:
+    """
+    Searches priceline hotels as stays
+
+    Params:
+    coordinates (tuple): center of search area as (lat, long)
+    checkIn (str): desired check in date YYYY-MM-DD
+    checkOut (str): desired check out date YYYY-MM-DD
+    range (int): not used by priceline
+    limit (int): number of results returned per page
+    page (int): 1-base indexed page of results to start from
+    max_pages (int): budget of pages to fetch, fewer are fetched once a page comes back short
+
+    Returns: 
+    - (list of Stay)
+    """
+
+    return list(iter_priceline_stays(coordinates, checkIn, checkOut, limit, page, max_pages))
+
+def search_airbnb_stays(coordinates:tuple, checkIn:str, checkOut:str, range:int=500, limit:int=5, page:int=1, max_pages:int=SEARCH_MAX_PAGES) -> List[Stay]:
+    """
+    Searches airbnbs as stays
+
+    Params:
+    coordinates (tuple): center of search area as (lat, long)
+    checkIn (str): desired check in date YYYY-MM-DD
+    checkOut (str): desired check out date YYYY-MM-DD
+    range (int): metres from searched address
+    limit (int): not used by airbnb
+    page (int): not used by airbnb
+    max_pages (int): budget of search pages of airbnb.search.SEARCH_PAGE_SIZE airbnbs, fewer are fetched once a page comes back short
+
+    Returns: 
+    - (list of Stay)
+    """
+
+    airbnbs = search_airbnb(coordinates, checkIn, checkOut, range, max_pages=max_pages)
+    if airbnbs is None:
+        return []
+
+    return [airbnb_to_stay(airbnb, checkIn, checkOut) for airbnb in airbnbs]
+
+# every accommodation provider searched by search_all_stays. Each takes (coordinates, checkIn, checkOut, range, limit, page, max_pages) and returns a list of Stay
+STAY_PROVIDERS = {
+    "airbnb": search_airbnb_stays,
+    "priceline": search_hotel_stays
+}
+
+# seconds to wait for each provider before giving up on its results
+PROVIDER_TIMEOUT_SEC = {
+    "airbnb": 90,
+    "priceline": 30
+}
+
+def search_all_stays(coordinates:tuple, checkIn:str, checkOut:str, range:int=500, limit:int=5, page:int=1, providers:list=None, max_pages:int=SEARCH_MAX_PAGES):
     """
     Takes all accommodation apis and searches across all of them with one function.
+    Providers are searched at the same time. A provider that fails or runs past its PROVIDER_TIMEOUT_SEC is left out 
+    so the other providers' results are still returned, unless it ran out of quota, which ends the search.
 
     Params:
     coordinates (tuple): center of search area as (lat, long)
@@ -14,93 +81,183 @@ def search_all_stays(coordinates:tuple, checkIn:str, checkOut:str, range:int=500
     range (int): metres from searched address, applies only to airbnbs.
     limit (int): number of results returned per page, applies only to priceline hotels.
     page (int): 1-base indexed page of results, applies only to priceline hotels.
+    providers (list): names of the STAY_PROVIDERS to search. Defaults to all of them
+    max_pages (int): budget of search pages fetched from each provider, see search_airbnb_stays and search_hotel_stays.
 
     Returns: 
     - DataFrame with details for airbnbs and priceline hotels within the search parameters
+
+    Raise:
+    - QuotaExceeded if a provider is out of quota, so a batch can stop and resume later instead of planning with missing providers
     """
 
-    col_order = ['accomodationId', 'accomodationTitle', 'city', 'avgGuestRating', 'checkIn', 'checkOut', 'lat', 'long']
-
-    hotels = search_priceline(coordinates, checkIn, checkOut, limit, page)
-    df_hotels = pd.DataFrame(hotels)
-    cols_hotels = {
-        'hotelId':'accomodationId'
-        , 'hotelName':'accomodationTitle'
-        , 'cityName':'city'
-        , 'overallGuestRating':'avgGuestRating'
-        #, 'dealTypes'
-        #, 'nightlyRateIncludingTaxesAndFees'
-        #, 'grandTotal'
-        , 'checkIn':'checkIn'
-        , 'checkOut':'checkOut'
-        , 'latitude':'lat'
-        , 'longitude':'long'
-    }
-    df_hotels.rename(columns=cols_hotels, inplace=True)
-    df_hotels = df_hotels[col_order]
-    df_hotels["stayType"] = 'hotel'
-
-    airbnbs = search_airbnb(coordinates, checkIn, checkOut, range)
-    if airbnbs is not None:
-        df_airbnbs = pd.DataFrame(airbnbs)
-        cols_airbnb = {
-        'airbnb_id':'accomodationId'
-        , 'listingTitle':'accomodationTitle'
-        , 'city':'city'
-        # is this guest rating or hotel star-level?
-        , 'starRating':'avgGuestRating'
-
-        ### need to get price from another airbnb api call
-        #, 'nightlyRate'
-
-        #, 'maxGuestCapacity'
-        #, 'bedrooms'
-        #, 'beds'
-        #, 'bathrooms'
-        #, 'bathroomsShared'
-        #, 'propertyType'
-        #, 'cancel_policy'
-        #, 'min_nights'
-        #, 'max_nights'
-        , 'check_in_time':'checkIn'
-        , 'check_out_time':'checkOut'
-        #, 'listingstatus'
-        , 'listingLat':'lat'
-        , 'listingLng':'long'
+    import pandas as pd
+
+    providers = list(STAY_PROVIDERS) if providers is None else providers
+    start = time.monotonic()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, len(providers)))
+    futures = {
+        provider:executor.submit(STAY_PROVIDERS[provider], coordinates, checkIn, checkOut, range, limit, page, max_pages)
+        for provider in providers
         }
-        df_airbnbs.rename(columns=cols_airbnb, inplace=True)
-        df_airbnbs = df_airbnbs[col_order]
-        df_airbnbs["stayType"] = 'airbnb'
 
-        df = pd.concat([df_airbnbs, df_hotels]) 
-    else:
-        df = df_hotels
+    stays = []
+    try:
+        for provider, future in futures.items():
+            # every provider started at the same time so its deadline is measured from the start
+            remaining_sec = max(0, start + PROVIDER_TIMEOUT_SEC.get(provider, 60) - time.monotonic())
+            try:
+                stays.extend(future.result(timeout=remaining_sec))
+            except FutureTimeoutError:
+                print(f"{provider} timed out after {PROVIDER_TIMEOUT_SEC.get(provider, 60)} seconds, continuing without it")
+            except QuotaExceeded:
+                raise
+            except Exception as e:
+                print(f"{provider} search failed, continuing without it: {e}")
+    finally:
+        # don't block on a provider that timed out
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # one frame built straight from the stays, no per-provider frames to rename and concat
+    df = stays_to_frame(stays)
 
     df['createdTimestamp'] = pd.Timestamp.now()  
 
     return df
 
-def get_best_stay(df, centroid: tuple) -> dict:
+# streaming version of each STAY_PROVIDERS entry, same arguments plus the stop event, yields Stay as results arrive
+STAY_STREAMS = {
+    "airbnb": lambda coordinates, checkIn, checkOut, range, limit, page, stop: iter_airbnbs(coordinates, checkIn, checkOut, range, stop=stop),
+    "priceline": lambda coordinates, checkIn, checkOut, range, limit, page, stop: iter_priceline_stays(coordinates, checkIn, checkOut, limit, page, SEARCH_MAX_PAGES, stop=stop)
+}
+
+_STREAM_DONE = object()
+
+def _drain_stream(provider:str, stream:Iterator[Stay], results:queue.Queue, stop:threading.Event) -> None:
+    """
+    Moves one provider's stays onto the shared results queue until the provider is done or the consumer stops
+
+    Params:
+    - provider (str): name of the provider
+    - stream (generator): the provider's stays
+    - results (queue.Queue): shared queue read by stream_stays
+    - stop (threading.Event): set once the consumer has enough stays, the stream checks it before every call it starts
     """
-    Determine what accommodation is closest to the center of the search area
+
+    try:
+        for stay in stream:
+            if stop.is_set():
+                break
+            results.put(stay)
+    except QuotaExceeded as e:
+        # handed to the consumer to raise, a thread of its own cannot
+        results.put(e)
+    except Exception as e:
+        print(f"{provider} search failed, continuing without it: {e}")
+    finally:
+        # the stream already stopped starting lookups when stop was set, closing it cancels the ones queued
+        stream.close()
+        results.put(_STREAM_DONE)
+
+def stream_stays(coordinates:tuple, checkIn:str, checkOut:str, range:int=500, limit:int=5, page:int=1, providers:list=None, enough:int=None, min_rating:float=0.8) -> Iterator[Stay]:
+    """
+    Streams stays from every provider as each response and availability check completes, for interactive use.
+    Stops every provider once enough good-enough stays have arrived, which saves their remaining calendar and details calls.
+
+    Params:
+    coordinates (tuple): center of search area as (lat, long)
+    checkIn (str): desired check in date YYYY-MM-DD
+    checkOut (str): desired check out date YYYY-MM-DD
+    range (int): metres from searched address, applies only to airbnbs.
+    limit (int): number of results returned per page, applies only to priceline hotels.
+    page (int): 1-base indexed page of results, applies only to priceline hotels.
+    providers (list): names of the STAY_STREAMS to search. Defaults to all of them
+    enough (int): stop after this many good-enough stays. Defaults to streaming everything
+    min_rating (float): rating, on a 0 to 1 scale, that makes a stay good enough. See rankStays.normalize_ratings
+
+    Yields:
+    - (Stay): stays in the order they arrive
+
+    Raise:
+    - QuotaExceeded if a provider is out of quota
+    """
+
+    providers = list(STAY_STREAMS) if providers is None else providers
+    results = queue.Queue()
+    stop = threading.Event()
+
+    for provider in providers:
+        stream = STAY_STREAMS[provider](coordinates, checkIn, checkOut, range, limit, page, stop)
+        threading.Thread(target=_drain_stream, args=(provider, stream, results, stop), daemon=True).start()
+
+    n_done = 0
+    n_good = 0
+    try:
+        while n_done < len(providers):
+            stay = results.get()
+            if stay is _STREAM_DONE:
+                n_done += 1
+                continue
+            elif isinstance(stay, QuotaExceeded):
+                raise stay
+
+            yield stay
+
+            if normalize_ratings([stay.avgGuestRating], [stay.stayType])[0] >= min_rating:
+                n_good += 1
+                if enough is not None and n_good >= enough:
+                    return
+    finally:
+        stop.set()
+
+def get_best_stay(df, centroid: tuple, max_candidates:int=5, weights:dict=None, max_distance_km:float=None) -> dict:
+    """
+    Determine the best accommodation for a stop. Every stay is scored in one vectorized pass on straight line distance, rating and price
+    (see rankStays.top_k_stays), then only the best scoring candidates are sent to a single duration matrix request
+    and the one closest by driving time to the center of the search area is chosen.
 
     Params:
     - df (pd.DataFrame): combined data for all accommodation providers including the location's coordinates
     - centroid (tuple): center of the search area as lat, long
+    - max_candidates (int): number of best scoring stays sent to the duration matrix
+    - weights (dict): see rankStays.score_stays
+    - max_distance_km (float): see rankStays.score_stays
     
     Returns:
-    - (dict) the row from the dataframe that contains the best stay
+    - (dict) the row from the dataframe that contains the best stay, with its score and distanceKm
+
+    Raise:
+    - if there are no stays to choose from
+    - QuotaExceeded if the duration matrix is out of budget, any other error of the matrix request falls back to the best scoring stay
     """
-    best_stay = None
-    best_proximity = None
 
-    for index, row in df.iterrows():
-        start_coordinates = (row["lat"], row["long"])
-        driving_directions = get_driving_directions(start_coordinates, centroid)
-        proximity_to_centroid = driving_directions["features"][0]["properties"]["summary"]["duration"]
+    if len(df) == 0:
+        raise ValueError(f"No stays found near {centroid}")
+
+    candidates = top_k_stays(df, centroid, k=max_candidates, weights=weights, max_distance_km=max_distance_km)
+
+    if len(candidates) == 1:
+        return candidates.iloc[0].to_dict()
 
-        if best_stay is None or proximity_to_centroid < best_proximity:
-            best_proximity = proximity_to_centroid # update with the better value
-            best_stay = df.iloc[index]
+    sources = list(zip(candidates["lat"].tolist(), candidates["long"].tolist()))
+    try:
+        durations = get_duration_matrix(sources, [centroid])
+    except QuotaExceeded:
+        raise
+    except Exception as e:
+        # the shortlist is already scored, a failed matrix request only loses the driving time tie-break
+        print(f"Could not get driving times near {centroid}, using the best scoring stay: {e}")
+        return candidates.iloc[0].to_dict()
+
+    durations = np.array([np.inf if row[0] is None else row[0] for row in durations], dtype=np.float64)
+
+    if np.isinf(durations).all():
+        # nothing could be routed, fall back to the best scoring stay
+        print(f"No routable stays near {centroid}, using the best scoring stay")
+        best_position = 0
+    else:
+        # candidates are best first, so a tie in driving time goes to the better scoring stay
+        best_position = int(np.argmin(durations))
 
-    return best_stay.to_dict()
\ No newline at end of file
+    return candidates.iloc[best_position].to_dict()
\ No newline at end of file
@@ -0,0 +1,64 @@
+import os
+import sys
+import pytest
+
+# the app modules import each other relative to the app folder, eg. from api_calls.cache import cached
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from api_calls import cache
+from api_calls import listing_store
+from api_calls import quota
+from api_calls import settings
+
+@pytest.fixture
+def loaded_settings(monkeypatch, tmp_path):
+    """
+    Loads the settings with only AIRBNB_KEY_2 and OPENROUTE_KEY set and points the quota store at a temp file
+
+    Returns:
+    - (Settings): the settings every module now shares
+    """
+
+    for key_name in settings.API_KEY_NAMES:
+        monkeypatch.delenv(key_name, raising=False)
+    monkeypatch.setenv("AIRBNB_KEY_2", "airbnb-two")
+    monkeypatch.setenv("OPENROUTE_KEY", "openroute")
+    monkeypatch.setattr(settings, "_settings", settings.load_settings())
+    monkeypatch.setattr(quota, "QUOTA_PATH", str(tmp_path/"quota.sqlite"))
+    monkeypatch.setattr(quota, "_connection", None)
+    monkeypatch.setattr(quota, "_buckets", {})
+
+    yield settings.get_settings()
+
+    if quota._connection is not None:
+        quota._connection.close()
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    """
+    Points the listing store at an empty temp file
+    """
+
+    monkeypatch.setattr(listing_store, "LISTINGS_PATH", str(tmp_path/"listings.sqlite"))
+    monkeypatch.setattr(listing_store, "_connection", None)
+    monkeypatch.setattr(listing_store, "_index", None)
+
+    yield listing_store
+
+    if listing_store._connection is not None:
+        listing_store._connection.close()
+
+@pytest.fixture
+def response_cache(monkeypatch, tmp_path):
+    """
+    Points the response cache at an empty temp file and turns it on
+    """
+
+    monkeypatch.setattr(cache, "CACHE_PATH", str(tmp_path/"responses.sqlite"))
+    monkeypatch.setattr(cache, "_connection", None)
+    monkeypatch.setattr(cache, "_enabled", True)
+
+    yield cache
+
+    if cache._connection is not None:
+        cache._connection.close()
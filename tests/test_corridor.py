@@ -0,0 +1,76 @@
+import pytest
+import searchCorridor
+from api_calls.airbnb import search as airbnb
+
+CENTER = (50.0, -114.0)
+
+@pytest.fixture
+def airbnb_pages(monkeypatch):
+    """
+    Stands in for the airbnb search api with 120 airbnbs, recording the offset of every page requested
+
+    Returns:
+    - (list): offsets requested
+    """
+
+    offsets = []
+
+    def get_airbnbs_near_lat_long(lat, lon, **query):
+        offsets.append(query["offset"])
+        airbnb_ids = range(query["offset"], min(query["offset"] + airbnb.SEARCH_PAGE_SIZE, 120))
+        return [{"airbnb_id":airbnb_id, "distance":float(airbnb_id)} for airbnb_id in airbnb_ids]
+
+    monkeypatch.setattr(airbnb, "get_airbnbs_near_lat_long", get_airbnbs_near_lat_long)
+
+    return offsets
+
+def test_search_pages_until_a_short_page(store, airbnb_pages):
+    airbnbs = airbnb.find_airbnbs(CENTER, 20000, max_pages=5)
+
+    assert airbnb_pages == [0, 50, 100]
+    assert [result["airbnb_id"] for result in airbnbs] == list(range(120))
+    # every airbnb of the area was found so the search stands in for later ones
+    assert len(store.find_search("airbnb", *CENTER, 20000, 3600, id_field="airbnb_id")) == 120
+
+def test_search_cut_short_by_its_budget_is_not_stored(store, airbnb_pages):
+    airbnbs = airbnb.find_airbnbs(CENTER, 20000, max_pages=2)
+
+    assert airbnb_pages == [0, 50]
+    assert len(airbnbs) == 100
+    assert store.find_search("airbnb", *CENTER, 20000, 3600, id_field="airbnb_id") is None
+
+def make_directions(hours:float) -> dict:
+    """
+    A straight route east driven at 90 km/h, one step per hour
+    """
+
+    coordinates = [[-122.0 + index*90/(111.32*0.64), 50.0] for index in range(int(hours) + 1)]
+    steps = [{"duration":3600.0, "distance":90000.0, "way_points":[index, index + 1]} for index in range(int(hours))]
+    duration = 3600.0*int(hours)
+
+    return {
+        "features":[
+            {
+                "geometry":{"coordinates":coordinates},
+                "properties":{"segments":[{"duration":duration, "steps":steps}], "summary":{"duration":duration}}
+            }
+        ]
+    }
+
+def test_corridor_search_calls_are_bounded(monkeypatch):
+    import pandas as pd
+
+    calls = []
+
+    def search_all_stays(center, checkIn, checkOut, range, limit, max_pages):
+        calls.append((checkIn, limit, max_pages))
+        return pd.DataFrame(columns=["accomodationId", "stayType", "lat", "long"])
+
+    monkeypatch.setattr(searchCorridor, "search_all_stays", search_all_stays)
+
+    nights = searchCorridor.search_corridor(make_directions(20), 7, "2025-03-25", max_workers=1)
+
+    assert len(nights) == 2
+    assert len(calls) == sum(len(night["search_centers"]) for night in nights)
+    assert all(max_pages == searchCorridor.CORRIDOR_MAX_PAGES for _, _, max_pages in calls)
+    assert [night["max_search_calls"] for night in nights] == [len(night["search_centers"])*len(searchCorridor.STAY_PROVIDERS)*searchCorridor.CORRIDOR_MAX_PAGES for night in nights]
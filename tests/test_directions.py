@@ -0,0 +1,88 @@
+import random
+import pytest
+from api_calls.openroute_service.directions import RouteIndex, get_overnight_cut_points
+
+def make_directions(rng:random.Random, n_segments:int, n_steps:int) -> dict:
+    """
+    Builds a random directions response with the fields RouteIndex reads
+
+    Params:
+    - rng (random.Random): seeded generator
+    - n_segments (int): number of segments
+    - n_steps (int): number of steps in each segment
+
+    Returns:
+    - (dict): directions like get_driving_directions returns
+    """
+
+    coordinates = [[-122.0, 49.0]]
+    segments = []
+    for _ in range(n_segments):
+        steps = []
+        for _ in range(n_steps):
+            first = len(coordinates) - 1
+            for _ in range(rng.randint(1, 4)):
+                coordinates.append([coordinates[-1][0] + rng.uniform(0, 0.05), coordinates[-1][1] + rng.uniform(-0.05, 0.05)])
+            # some steps are instant, some longer than a whole day
+            duration = rng.choice([0.0, rng.uniform(1, 600), rng.uniform(600, 7200), rng.uniform(7200, 40000)])
+            steps.append({"duration":duration, "distance":duration*25, "way_points":[first, len(coordinates) - 1]})
+        segments.append({"duration":sum(step["duration"] for step in steps), "steps":steps})
+
+    return {"features":[{"geometry":{"coordinates":coordinates}, "properties":{"segments":segments}}]}
+
+def walk_cut_sec(directions:dict, max_driving_hours_per_day:float) -> list:
+    """
+    The step walk get_overnight_cut_points used before RouteIndex, kept as the reference.
+    The walk could also cut at the finish when the route ended on zero-duration steps, RouteIndex never stops there
+
+    Returns:
+    - (list of tuples): elapsed_time_sec and driving_time_sec of every cut before the finish
+    """
+
+    driving_limit_sec = max_driving_hours_per_day*60*60
+    segments = directions["features"][0]["properties"]["segments"]
+    total_duration_sec = sum(segment["duration"] for segment in segments)
+
+    cuts = []
+    day_start_sec = 0
+    time_elapsed_sec = 0
+    for segment in segments:
+        for step in segment["steps"]:
+            if time_elapsed_sec + step["duration"] - day_start_sec > driving_limit_sec and day_start_sec < time_elapsed_sec < total_duration_sec - 1e-6:
+                cuts.append((time_elapsed_sec, time_elapsed_sec - day_start_sec))
+                day_start_sec = time_elapsed_sec
+            time_elapsed_sec += step["duration"]
+            if total_duration_sec - day_start_sec <= driving_limit_sec:
+                return cuts
+
+    return cuts
+
+@pytest.mark.parametrize("seed", range(200))
+def test_cut_points_match_step_walk(seed):
+    rng = random.Random(seed)
+    directions = make_directions(rng, rng.randint(1, 3), rng.randint(1, 30))
+    hours = rng.choice([0.5, 2, 4.5, 7, 10])
+
+    cut_points = get_overnight_cut_points(directions, hours)
+
+    assert [(cut["elapsed_time_sec"], cut["driving_time_sec"]) for cut in cut_points] == pytest.approx(walk_cut_sec(directions, hours))
+
+@pytest.mark.parametrize("seed", range(50))
+def test_interpolated_cut_points_land_on_the_limit(seed):
+    rng = random.Random(seed)
+    directions = make_directions(rng, rng.randint(1, 3), rng.randint(1, 30))
+    hours = rng.choice([0.5, 2, 4.5, 7, 10])
+    route_index = RouteIndex(directions)
+
+    cut_points = route_index.cut_points(hours, interpolate=True)
+
+    assert len(cut_points) == max(0, -(-route_index.total_duration_sec//(hours*3600)) - 1)
+    assert all(cut["driving_time_sec"] == pytest.approx(hours*3600) for cut in cut_points)
+
+@pytest.mark.parametrize("interpolate", [False, True])
+@pytest.mark.parametrize("hours", [0, -1])
+def test_cut_points_reject_a_limit_that_never_ends_a_day(hours, interpolate):
+    route_index = RouteIndex(make_directions(random.Random(0), 1, 5))
+
+    with pytest.raises(ValueError):
+        route_index.cut_points(hours, interpolate)
@@ -0,0 +1,23 @@
+from api_calls.geocoder import search
+
+def test_stand_in_results_are_not_persisted(response_cache):
+    assert search.get_batch_geocoded_addresses(["Calgary, Alberta"], geocoder=lambda address: (0.0, 0.0)) == [(0.0, 0.0)]
+    assert search.get_batch_geocoded_addresses(["Calgary, Alberta"], geocoder=lambda address: (51.05, -114.07)) == [(51.05, -114.07)]
+    assert response_cache.lookup(search.GAZETTEER_ENDPOINT, {"address":"calgary alberta"}) is None
+
+def test_default_geocoder_is_served_from_the_gazetteer(response_cache):
+    response_cache.store(search.GAZETTEER_ENDPOINT, {"address":"calgary alberta"}, [51.05, -114.07], "geocode")
+
+    assert search.get_batch_geocoded_addresses(["Calgary,  Alberta", "calgary alberta"]) == [(51.05, -114.07), (51.05, -114.07)]
+
+def test_duplicates_are_geocoded_once(response_cache):
+    calls = []
+
+    def geocoder(address):
+        calls.append(address)
+        return (float(len(address)), 0.0)
+
+    coordinates = search.get_batch_geocoded_addresses(["1709 F Street, Bellingham", "1709 f street bellingham", "Calgary"], geocoder=geocoder)
+
+    assert sorted(calls) == ["1709 f street bellingham", "calgary"]
+    assert coordinates[0] == coordinates[1] != coordinates[2]
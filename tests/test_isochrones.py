@@ -0,0 +1,55 @@
+import pytest
+import searchIsochrones
+from api_calls.openroute_service import isochrone
+
+@pytest.fixture
+def isochrone_calls(response_cache, monkeypatch):
+    """
+    Stands in for the isochrone api with a square around each location, half a degree across per hour,
+    and scores grid points by how far east they are
+
+    Returns:
+    - (list): (locations, driving_times) of every isochrone call
+    """
+
+    calls = []
+
+    def request_isochrones(locations, driving_times):
+        calls.append((list(locations), list(driving_times)))
+        features = []
+        for group_index, (long, lat) in enumerate(locations):
+            for hours in driving_times:
+                half = hours/4
+                square = [[long-half, lat-half], [long+half, lat-half], [long+half, lat+half], [long-half, lat+half], [long-half, lat-half]]
+                features.append({"geometry":{"type":"Polygon", "coordinates":[square]}, "properties":{"group_index":group_index, "value":hours*3600}})
+        return {"features":features}
+
+    monkeypatch.setattr(isochrone, "request_isochrones", request_isochrones)
+    monkeypatch.setattr(searchIsochrones, "get_duration_matrix", lambda sources, destinations: [[(destinations[0][1] - long)*3600] for _, long in sources])
+
+    return calls
+
+SEARCHES = [
+    ((49.98, -110.65), (49.78, -109.0), 0.6),
+    ((50.50, -112.00), (50.40, -111.0), 0.6),
+    ((51.05, -114.07), (51.00, -113.0), 1.0)
+]
+
+def test_searches_share_one_isochrone_call(isochrone_calls):
+    results = searchIsochrones.search_many(SEARCHES)
+
+    # the two ranges can't share a call since every range is applied to every location
+    assert sorted((len(locations), driving_times) for locations, driving_times in isochrone_calls) == [(1, [1.0]), (2, [0.6])]
+    for result, (coordinates_a, _, driving_hours) in zip(results, SEARCHES):
+        # the easternmost grid point is the closest to a destination further east
+        assert coordinates_a[1] < result["coordinates"][1] <= coordinates_a[1] + driving_hours/4
+
+def test_repeated_and_nearby_searches_are_served_from_the_tile_cache(isochrone_calls):
+    searchIsochrones.search_many(SEARCHES)
+    n_calls = len(isochrone_calls)
+
+    nearby = [((lat + 0.001, long - 0.001), destination, driving_hours) for (lat, long), destination, driving_hours in SEARCHES]
+    searchIsochrones.search_many(SEARCHES + nearby)
+    searchIsochrones.search(*SEARCHES[0])
+
+    assert len(isochrone_calls) == n_calls
@@ -0,0 +1,77 @@
+import random
+import pytest
+from api_calls import listing_store
+
+CENTER = (50.0, -114.0)
+
+def make_listings(rng:random.Random, n:int, spread:float=0.15) -> list:
+    """
+    Random listings around CENTER
+
+    Returns:
+    - (list of dictionaries): listing_id, lat, long, rating and details like save_listings takes
+    """
+
+    listings = []
+    for listing_id in range(n):
+        lat, long = CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread)
+        listings.append({"listing_id":listing_id, "lat":lat, "long":long, "rating":4.5, "details":{"airbnb_id":listing_id}})
+
+    return listings
+
+def search_results(listings:list, lat:float, long:float, radius_m:float) -> list:
+    """
+    What the search api returns for the listings around a point
+    """
+
+    distances_m = listing_store._distances_m([listing["lat"] for listing in listings], [listing["long"] for listing in listings], lat, long)
+
+    return [{"airbnb_id":listing["listing_id"], "distance":float(distance_m)} for listing, distance_m in zip(listings, distances_m) if distance_m <= radius_m]
+
+def test_unplaced_result_sends_the_live_search(store):
+    listings = make_listings(random.Random(1), 6, spread=0.02)
+    store.save_search("airbnb", *CENTER, 20000, search_results(listings, *CENTER, 20000))
+
+    # none of the listings' details were fetched so they cannot be placed around an off-centre point
+    assert store.find_search("airbnb", 50.045, -114.0, 2000, 3600, id_field="airbnb_id") is None
+
+def test_same_center_is_exact_without_details(store):
+    listings = make_listings(random.Random(2), 30)
+    store.save_search("airbnb", *CENTER, 20000, search_results(listings, *CENTER, 20000))
+
+    found = store.find_search("airbnb", *CENTER, 5000, 3600, id_field="airbnb_id")
+    expected = search_results(listings, *CENTER, 5000)
+
+    assert [result["airbnb_id"] for result in found] == [result["airbnb_id"] for result in sorted(expected, key=lambda result: result["distance"])]
+
+def test_stored_listings_are_placed_around_an_off_centre_point(store):
+    listings = make_listings(random.Random(3), 60)
+    store.save_search("airbnb", *CENTER, 20000, search_results(listings, *CENTER, 20000))
+    store.save_listings("airbnb", listings)
+
+    lat, long = 50.045, -114.02
+    found = store.find_search("airbnb", lat, long, 4000, 3600, id_field="airbnb_id")
+    expected = search_results(listings, lat, long, 4000)
+
+    assert {result["airbnb_id"] for result in found} == {result["airbnb_id"] for result in expected}
+    assert [result["distance"] for result in found] == sorted(result["distance"] for result in found)
+
+def test_uncovered_area_is_not_found(store):
+    store.save_search("airbnb", *CENTER, 2000, [])
+
+    assert store.find_search("airbnb", *CENTER, 2000, 3600, id_field="airbnb_id") == []
+    assert store.find_search("airbnb", *CENTER, 3000, 3600, id_field="airbnb_id") is None
+    assert store.find_search("airbnb", 50.02, -114.0, 2000, 3600, id_field="airbnb_id") is None
+
+@pytest.mark.parametrize("seed", range(10))
+def test_query_radius_matches_brute_force(store, seed):
+    rng = random.Random(seed)
+    listings = make_listings(rng, 200)
+    store.save_listings("airbnb", listings)
+    lat, long, radius_m = CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.1, 0.1), rng.uniform(500, 15000)
+
+    found = store.query_radius(lat, long, radius_m, "airbnb")
+    expected = search_results(listings, lat, long, radius_m)
+
+    assert {int(listing["listing_id"]) for listing in found} == {result["airbnb_id"] for result in expected}
+    assert store.query_radius(lat, long, radius_m, "priceline") == []
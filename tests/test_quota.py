@@ -0,0 +1,29 @@
+import time
+import pytest
+from api_calls import quota
+
+def test_listing_search_is_not_throttled(loaded_settings):
+    # one search page of 50 listings, then the details and calendar of each
+    start = time.monotonic()
+    keys = [quota.acquire("airbnb", block=False) for _ in range(1 + 50*2)]
+
+    assert time.monotonic() - start < 5
+    assert set(keys) == {"airbnb-two"}
+    assert quota.remaining("airbnb") == {"month":quota.PROVIDER_QUOTAS["airbnb"]["month"] - 101}
+
+def test_caps_are_enforced_by_the_counters(loaded_settings, monkeypatch):
+    monkeypatch.setitem(quota.PROVIDER_QUOTAS, "airbnb", {"keys":["AIRBNB_KEY_1", "AIRBNB_KEY_2"], "month":3})
+
+    for _ in range(3):
+        quota.acquire("airbnb", block=False)
+
+    with pytest.raises(quota.QuotaExceeded):
+        quota.acquire("airbnb", block=False)
+
+def test_rate_limited_provider_is_paced(loaded_settings):
+    per_minute = quota.PROVIDER_QUOTAS["openroute_isochrone"]["per_minute"]
+    for _ in range(per_minute):
+        quota.acquire("openroute_isochrone", block=False)
+
+    with pytest.raises(quota.QuotaExceeded):
+        quota.acquire("openroute_isochrone", block=False)
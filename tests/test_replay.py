@@ -0,0 +1,99 @@
+import os
+import json
+import threading
+import pytest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from api_calls import quota
+from api_calls import replay
+from api_calls import sessions
+
+class _LiveHandler(BaseHTTPRequestHandler):
+    """
+    Stands in for a live api, answering with the request it received, less the api key, and how many it has answered
+    """
+
+    def _answer(self) -> None:
+        parts = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode("utf-8") if length > 0 else None
+        self.server.calls += 1
+        text = parse_qs(parts.query).get("text")
+        payload = json.dumps({"method":self.command, "path":parts.path, "text":text, "body":body, "call":self.server.calls}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = _answer
+    do_POST = _answer
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+@pytest.fixture
+def live_url():
+    """
+    Runs the live api stand-in on a free local port
+
+    Returns:
+    - (str): its base url
+    """
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _LiveHandler)
+    server.calls = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
+
+def send_requests(base_url:str) -> list:
+    """
+    The requests a planner would send, with an api key that changes between recording and replay
+
+    Returns:
+    - (list): the json of each response
+    """
+
+    api_key = os.urandom(4).hex()
+
+    return [
+        sessions.get(f"{base_url}/v1/geocode/search", params={"text":"calgary alberta", "apiKey":api_key}).json(),
+        sessions.get(f"{base_url}/v1/geocode/search", params={"text":"bellingham washington", "apiKey":api_key}).json(),
+        sessions.post(f"{base_url}/v2/matrix/driving-car", json={"locations":[[-114.0, 51.0], [-122.0, 48.7]]}).json()
+    ]
+
+def test_recorded_responses_replay_without_the_live_api(live_url, tmp_path):
+    with replay.record(str(tmp_path)) as recorder:
+        recorded = send_requests(live_url)
+
+    assert recorder.recorded == 3
+    for file_name in os.listdir(tmp_path):
+        with open(tmp_path/file_name, "r") as f:
+            assert "apiKey" not in f.read()
+
+    with replay.replay(str(tmp_path), latency_sec=0.01) as server:
+        replayed = send_requests(live_url)
+        missing = sessions.get(f"{live_url}/v1/geocode/search", params={"text":"miami florida"})
+
+    assert replayed == recorded
+    assert missing.status_code == 404
+    assert (server.hits, server.misses) == (3, 1)
+    # the live api was only called while recording, the calls it counted come back unchanged
+    assert [response["call"] for response in replayed] == [1, 2, 3]
+
+def test_calls_are_not_paced_while_pacing_is_off(loaded_settings):
+    per_minute = quota.PROVIDER_QUOTAS["openroute_matrix"]["per_minute"]
+
+    pacing = quota.set_pacing(False)
+    try:
+        for _ in range(per_minute*2):
+            quota.acquire("openroute_matrix", block=False)
+    finally:
+        quota.set_pacing(pacing)
+
+    # every call still counts against the daily cap
+    assert quota.remaining("openroute_matrix") == {"day":quota.PROVIDER_QUOTAS["openroute_matrix"]["day"] - per_minute*2}
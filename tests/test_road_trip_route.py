@@ -0,0 +1,51 @@
+import getRoadTripRoute
+
+def make_directions(step_hours:list) -> dict:
+    """
+    A straight route east of one step per entry of step_hours
+
+    Returns:
+    - (dict): directions like get_driving_directions returns
+    """
+
+    coordinates = [[-122.0 + index*0.5, 49.0] for index in range(len(step_hours) + 1)]
+    steps = [{"duration":hours*3600, "distance":hours*90000, "way_points":[index, index + 1]} for index, hours in enumerate(step_hours)]
+    duration = sum(step["duration"] for step in steps)
+
+    return {
+        "features":[
+            {
+                "geometry":{"coordinates":coordinates},
+                "properties":{"segments":[{"duration":duration, "steps":steps}], "summary":{"duration":duration}}
+            }
+        ]
+    }
+
+def fake_detour(hours:float):
+    """
+    Stand-in for get_driving_directions where every detour takes the same time
+    """
+
+    return lambda start, finish: {"features":[{"properties":{"summary":{"duration":hours*3600}}}]}
+
+def test_final_day_is_returned_with_the_nights(monkeypatch):
+    monkeypatch.setattr(getRoadTripRoute, "choose_stay", lambda coordinates, checkIn, checkOut: {"stay":{"lat":coordinates[0], "long":coordinates[1]}, "stay_coordinates":coordinates})
+    monkeypatch.setattr(getRoadTripRoute, "get_driving_directions", fake_detour(0.5))
+
+    # cut after 6 and 12 hours, then 6.8 hours to the finish plus the half hour back from the last stay
+    nights, final_day = getRoadTripRoute.plan_overnight_stays(make_directions([6, 6, 6.8]), 7, "2025-03-25", max_workers=1)
+
+    assert [night["checkIn"] for night in nights] == ["2025-03-25", "2025-03-26"]
+    assert [night["exceeds_limit"] for night in nights] == [False, False]
+    assert final_day["day_driving_time_sec"] == 7.3*3600
+    assert final_day["exceeds_limit"]
+
+def test_night_without_stay_keeps_planning(monkeypatch):
+    monkeypatch.setattr(getRoadTripRoute, "choose_stay", lambda coordinates, checkIn, checkOut: {"stay":None, "stay_coordinates":None})
+    monkeypatch.setattr(getRoadTripRoute, "get_driving_directions", fake_detour(0.5))
+
+    nights, final_day = getRoadTripRoute.plan_overnight_stays(make_directions([6, 6, 5]), 7, "2025-03-25", max_workers=2)
+
+    assert [night["detour_duration_sec"] for night in nights] == [0, 0]
+    assert [getRoadTripRoute.route_stop(night) for night in nights] == [night["cut_coordinates"] for night in nights]
+    assert final_day == {"day_driving_time_sec":5*3600, "exceeds_limit":False}
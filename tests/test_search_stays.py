@@ -0,0 +1,90 @@
+import pytest
+import searchStays
+import getRoadTripRoute
+from api_calls.priceline import search as priceline
+from api_calls.quota import QuotaExceeded
+from api_calls.stays import Stay, stays_to_frame
+
+CENTROID = (50.0, -114.0)
+
+def make_stays() -> list:
+    """
+    Three hotels, the first nearest and best rated so it scores best
+    """
+
+    return [
+        Stay(str(index), f"hotel {index}", "Calgary", rating, 100.0, "2025-03-25", "2025-03-26", CENTROID[0] + offset, CENTROID[1], "hotel")
+        for index, (rating, offset) in enumerate([(9.0, 0.001), (7.0, 0.01), (6.0, 0.02)])
+    ]
+
+def test_matrix_picks_the_fastest_candidate(monkeypatch):
+    monkeypatch.setattr(searchStays, "get_duration_matrix", lambda sources, destinations: [[300.0], [60.0], [None]])
+
+    assert searchStays.get_best_stay(stays_to_frame(make_stays()), CENTROID)["accomodationId"] == "1"
+
+def test_matrix_error_falls_back_to_the_best_score(monkeypatch):
+    def fail(sources, destinations):
+        raise Exception("openrouteservice timed out")
+
+    monkeypatch.setattr(searchStays, "get_duration_matrix", fail)
+
+    assert searchStays.get_best_stay(stays_to_frame(make_stays()), CENTROID)["accomodationId"] == "0"
+
+def test_quota_exceeded_is_raised(monkeypatch):
+    def fail(sources, destinations):
+        raise QuotaExceeded("no openroute_matrix budget left")
+
+    monkeypatch.setattr(searchStays, "get_duration_matrix", fail)
+
+    with pytest.raises(QuotaExceeded):
+        searchStays.get_best_stay(stays_to_frame(make_stays()), CENTROID)
+
+def make_hotel(hotel_id:int) -> dict:
+    """
+    One hotel with the fields priceline.to_stay reads
+    """
+
+    return {
+        "hotelId":hotel_id,
+        "pclnId":f"p{hotel_id}",
+        "name":f"hotel {hotel_id}",
+        "overallGuestRating":8.0,
+        "ratesSummary":{"nightlyRateIncludingTaxesAndFees":120.0},
+        "location":{"latitude":CENTROID[0], "longitude":CENTROID[1], "address":{"cityName":"Calgary"}}
+    }
+
+@pytest.fixture
+def priceline_pages(monkeypatch):
+    """
+    Stands in for the priceline api with 50 hotels, recording each page requested
+
+    Returns:
+    - (list): (limit, page) of every page request
+    """
+
+    requests = []
+
+    def get_priceline_hotels(locationId, checkIn, checkOut, limit, page):
+        requests.append((limit, page))
+        return [make_hotel(hotel_id) for hotel_id in range((page - 1)*limit, min(page*limit, 50))]
+
+    monkeypatch.setattr(priceline, "get_priceline_location_id", lambda lat, lon: "1")
+    monkeypatch.setattr(priceline, "get_priceline_hotels", get_priceline_hotels)
+    monkeypatch.setattr(priceline, "_save_hotels", lambda hotels: None)
+
+    return requests
+
+def test_route_searches_pages_up_to_its_budget(priceline_pages, monkeypatch):
+    monkeypatch.delitem(searchStays.STAY_PROVIDERS, "airbnb")
+    monkeypatch.setattr(searchStays, "get_duration_matrix", lambda sources, destinations: [[60.0] for _ in sources])
+
+    stop = getRoadTripRoute.choose_stay(CENTROID, "2025-03-25", "2025-03-26")
+
+    assert priceline_pages == [(getRoadTripRoute.HOTEL_PAGE_SIZE, page + 1) for page in range(getRoadTripRoute.SEARCH_MAX_PAGES)]
+    assert stop["stay"]["stayType"] == "hotel"
+
+def test_short_page_ends_the_search(priceline_pages):
+    stays = searchStays.search_all_stays(CENTROID, "2025-03-25", "2025-03-26", limit=20, providers=["priceline"], max_pages=5)
+
+    assert priceline_pages == [(20, 1), (20, 2), (20, 3)]
+    assert len(stays) == 50
@@ -0,0 +1,46 @@
+import sys
+import subprocess
+import pytest
+from api_calls import quota
+from api_calls import settings
+
+# modules run as commands or imported by workers, each pays its import time on every start
+ENTRY_MODULES = ["getRoadTripRoute", "runTrips", "planScenarios", "searchCorridor"]
+
+@pytest.mark.parametrize("module", ENTRY_MODULES)
+def test_import_time_within_budget(module):
+    assert settings.measure_import_time(module) < settings.IMPORT_TIME_BUDGET_SEC
+
+def test_settings_does_not_import_quota():
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, api_calls.settings; print('api_calls.quota' in sys.modules)"],
+        cwd=settings.APP_DIR, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "False"
+
+def test_every_quota_key_is_loaded():
+    quota_key_names = {key_name for provider in quota.PROVIDER_QUOTAS.values() for key_name in provider["keys"]}
+    assert quota_key_names <= set(settings.API_KEY_NAMES)
+
+def test_load_settings_reads_keys_once(loaded_settings, monkeypatch):
+    assert dict(loaded_settings.api_keys) == {"AIRBNB_KEY_2":"airbnb-two", "OPENROUTE_KEY":"openroute"}
+    assert set(loaded_settings.missing_keys) == set(settings.API_KEY_NAMES) - {"AIRBNB_KEY_2", "OPENROUTE_KEY"}
+
+    # changing the environment later does not change the loaded keys
+    monkeypatch.setenv("AIRBNB_KEY_1", "airbnb-one")
+    assert "AIRBNB_KEY_1" not in settings.get_settings().api_keys
+    with pytest.raises(TypeError):
+        loaded_settings.api_keys["AIRBNB_KEY_1"] = "airbnb-one"
+
+def test_quota_reads_keys_from_settings(loaded_settings, monkeypatch):
+    monkeypatch.setenv("AIRBNB_KEY_1", "airbnb-one")
+    monkeypatch.setenv("AIRBNB_KEY_2", "changed")
+
+    assert quota.acquire("airbnb") == "airbnb-two"
+    assert quota.key_name_for("airbnb", "airbnb-two") == "AIRBNB_KEY_2"
+    assert quota.key_name_for("airbnb", "airbnb-one") is None
+    assert quota.remaining("airbnb")["month"] == quota.PROVIDER_QUOTAS["airbnb"]["month"] - 1
+
+def test_acquire_without_loaded_key(loaded_settings):
+    with pytest.raises(KeyError):
+        quota.acquire("priceline")